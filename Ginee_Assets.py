@@ -0,0 +1,143 @@
+import os
+import io
+import glob
+import hashlib
+import inspect
+import fitz
+import functools
+from threading import Lock
+from collections import OrderedDict
+
+
+class AssetCache():
+    """Process-wide cache of fonts, static images & rendered png bytes"""
+
+    def __init__(self, max_renders=1024, cache_folder=None):
+        self.max_renders = max_renders
+        self.cache_folder = cache_folder        # optional on-disk persistence of renders
+        self.fonts = {}
+        self.images = {}
+        self.metrics = {}                       # (path, text, size) -> text width
+        self.renders = OrderedDict()            # (kind, text, size) -> png bytes, least recently used first
+        self.hits, self.misses, self.disk_hits = 0, 0, 0
+        self.lock = Lock()
+
+    def font(self, path, size):
+        """Loads a truetype font once per (path, size)"""
+        key = (path, size)
+        if key not in self.fonts:
+            from PIL import ImageFont
+            self.fonts[key] = ImageFont.truetype(path, size=size)
+        return self.fonts[key]
+
+    def pdf_font(self, path):
+        """Loads a fitz font once per path, used for measuring vector text"""
+        key = ('pdf', path)
+        if key not in self.fonts:
+            self.fonts[key] = fitz.Font(fontfile=path)
+        return self.fonts[key]
+
+    def text_length(self, path, text, size):
+        """Measures text with a fitz font once per (path, text, size), meant for single words"""
+        key = (path, text, size)
+        if key not in self.metrics:
+            self.metrics[key] = self.pdf_font(path).text_length(text, size)
+        return self.metrics[key]
+
+    def image_bytes(self, path, format='PNG', pixels=None):
+        """Loads an image file once and returns it re-encoded in bytes
+
+        pixels downsamples it to fit a pixels x pixels square, e.g. its placed size at the printer's resolution"""
+        key = path if pixels is None else (path, pixels)
+        if key not in self.images:
+            from PIL import Image
+            with Image.open(path, 'r') as image:
+                if pixels:
+                    image.thumbnail((pixels, pixels), Image.LANCZOS)    # keeps the aspect ratio, never enlarges
+                imgByteArr = io.BytesIO()
+                image.save(imgByteArr, format=format)
+                self.images[key] = imgByteArr.getvalue()
+        return self.images[key]
+
+    def insert_image(self, page, rect, path, xrefs, stream=None, pixels=None):
+        """Embeds an image once per document, later pages reference it through xrefs, the document's path -> xref"""
+        if xrefs.get(path):
+            page.insert_image(rect, xref=xrefs[path])
+        else:
+            xrefs[path] = page.insert_image(rect, stream=stream or self.image_bytes(path, pixels=pixels))
+
+    def _disk_path(self, key):
+        return os.path.join(self.cache_folder, hashlib.sha1(repr(key).encode()).hexdigest() + '.png')
+
+    def render(self, kind, text, size, draw):
+        """Returns png bytes of (kind, text, size), calling draw() only on a miss"""
+        key = (kind, str(text), size)
+        with self.lock:
+            if key in self.renders:
+                self.hits += 1
+                self.renders.move_to_end(key)
+                return self.renders[key]
+
+        png = None
+        if self.cache_folder and os.path.exists(self._disk_path(key)):
+            with open(self._disk_path(key), 'rb') as f:
+                png = f.read()
+            os.utime(self._disk_path(key))      # keeps renders still in use when pruning
+            self.disk_hits += 1
+        else:
+            png = draw()
+            self.misses += 1
+            if self.cache_folder:
+                # written whole under a temporary name, other worker processes never read half a png
+                os.makedirs(self.cache_folder, exist_ok=True)
+                temp_location = f"{self._disk_path(key)}.{os.getpid()}.tmp"
+                with open(temp_location, 'wb') as f:
+                    f.write(png)
+                os.replace(temp_location, self._disk_path(key))
+
+        with self.lock:
+            self.renders[key] = png
+            if len(self.renders) > self.max_renders:
+                self.renders.popitem(last=False)
+        return png
+
+    def prune_disk_cache(self, max_files):
+        """Keeps the max_files most recently used renders on disk"""
+        if not self.cache_folder:
+            return
+        cached_renders = sorted(glob.glob(os.path.join(self.cache_folder, '*.png')), key=os.path.getmtime, reverse=True)
+        for cached_render in cached_renders[max_files:]:
+            os.remove(cached_render)
+
+    def cached(self, kind):
+        """Decorator caching a renderer whose first argument is the text to draw"""
+        def decorator(func):
+            signature = inspect.signature(func)
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                bound = signature.bind(*args, **kwargs)
+                bound.apply_defaults()
+                text, *size = bound.arguments.values()
+                return self.render(kind, text, tuple(size), lambda: func(*args, **kwargs))
+            return wrapper
+        return decorator
+
+    def counts(self):
+        return {'hits': self.hits, 'disk_hits': self.disk_hits, 'misses': self.misses}
+
+    def merge_counts(self, counts):
+        """Adds a worker process's hits & misses, e.g. the delta of counts() over one chunk"""
+        with self.lock:
+            self.hits += counts.get('hits', 0)
+            self.disk_hits += counts.get('disk_hits', 0)
+            self.misses += counts.get('misses', 0)
+
+    def stats(self):
+        return {'hits': self.hits, 'disk_hits': self.disk_hits, 'misses': self.misses,
+                'renders': len(self.renders), 'fonts': len(self.fonts), 'images': len(self.images),
+                'metrics': len(self.metrics)}
+
+
+# Shared by Ginee_PDF_Converter & Ginee_Packing_List
+assets = AssetCache()
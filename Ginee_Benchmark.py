@@ -0,0 +1,211 @@
+"""Benchmarks convert_packing_list & add_barcode on synthetic Ginee exports & picking lists
+
+    python Ginee_Benchmark.py                       # 10, 100, 1000 & 10000 orders, compared to the baseline
+    python Ginee_Benchmark.py --sizes 10 100        # quicker run
+    python Ginee_Benchmark.py --save-baseline       # stores this run as the new baseline
+
+Every case runs in its own process so peak RSS is per case, with GINEE_DOWNLOADS & GINEE_FOLDER
+pointing into a temporary folder holding the generated inputs & a copy of the fonts & images."""
+import os
+import sys
+import json
+import time
+import shutil
+import random
+import argparse
+import tempfile
+import subprocess
+import datetime as dt
+
+
+# File locations
+script_folder = os.path.dirname(os.path.abspath(__file__))
+baseline_location = os.path.join(script_folder, 'Ginee Benchmark Baseline.json')
+
+SIZES = [10, 100, 1000, 10000]
+TOOLS = ['convert_packing_list', 'add_barcode']
+REGRESSION = 1.10       # pages/sec below the baseline's / REGRESSION is flagged
+asset_files = ['LiberationSans-Regular.ttf', 'LiberationSans-Bold.ttf', 'MarckScript-Regular.ttf',
+               'ty for your purchase.jpg', 'package_icon.png']
+
+# Synthetic data modeled on real exports & the Packing List.json/Picking List.json fixtures
+buyer_names = ['Juan D. Cruz', 'maria clara santos', 'Jose P. Rizal/Jr', 'Ana', 'Ma. Theresa Dela Cruz-Villanueva']
+products = [('8022278609244', 'Marco TM80/N Set of Electromagnetic Horns 2 pin 12V car horn Made in Italy', ''),
+            ('ATFMT1P', '(ATF - ASIN - 1L) AISIN Fully Synthetic AT Fluid Wide Range AFW+ Automatic Transmission Fluid ATF 1 Liter', ''),
+            ('4954514956840', '(COOLANT - AISIN - GREEN - 1L) AISIN Long Life Coolant LLC / Anti-Freeze JIC Tropical Spec Formulation', ''),
+            ('2288083677-1629825463025-6', 'Coil Matting (1st Row / Front Seats Only)', 'Color Family:Black+Grey,Options:Toyota Hiace Commuter 2006-2018'),
+            ('ESSN1041P', 'Aisin Semi Synthetic Motor Oil for Gasoline Engines 10W-40 4 Liters', 'Size:4L'),
+            ('bf-pln-blk-med', 'Plain Buff Black', 'Size:M')]
+buyer_notes = [None, None, None, 'pls pack well', 'Please include a receipt, thank you!']
+
+
+def order_id(rng, i):
+    """Mixes numeric Shopee & alphanumeric Lazada style order ids"""
+    return f'4{rng.randint(10**13, 10**14 - 1)}' if i % 3 else f'210825H{rng.randint(10**6, 10**7 - 1)}'
+
+
+def generate_export(file_location, orders, seed=0):
+    """Writes a Ginee export excel of orders with 1-3 items each, ~1 in 10 items cancelled"""
+    import pandas as pd
+    rng = random.Random(seed)
+    rows = []
+    for i in range(1, orders + 1):
+        ginee_order_id, buyer_name, buyer_note = order_id(rng, i), rng.choice(buyer_names), rng.choice(buyer_notes)
+        for _ in range(rng.randint(1, 3)):
+            sku, product_name, product_variation = rng.choice(products)
+            rows.append({'NO.': float(i), 'Order ID': ginee_order_id, 'Buyer Name': buyer_name,
+                         'Product Name': product_name, 'Product Variation': product_variation or None,
+                         'SKU': sku, 'Inventory SKU': sku, 'Qty': rng.randint(1, 3),
+                         'Product Status': 'Cancelled' if rng.random() < 0.1 else 'Paid',
+                         'Buyer Note': buyer_note})
+        rows[-1]['Product Status'] = 'Paid'     # every order keeps at least one paid item
+    pd.DataFrame(rows).to_excel(file_location, index=False)
+
+
+def generate_picking_list(file_location, orders, seed=0):
+    """Writes a Ginee picking list pdf laid out like Picking List.json, ~1 in 8 orders has several packages"""
+    import io
+    import fitz
+    import qrcode
+    from textwrap import wrap
+
+    rng = random.Random(seed)
+    order_numbers = []
+    for i in range(1, orders + 1):
+        order_numbers += [order_id(rng, i)]*(rng.randint(2, 5) if rng.random() < 0.125 else 1)
+    buffered = io.BytesIO()
+    qrcode.make('ginee').save(buffered, format='PNG')      # stands in for the platform logo
+    logo_bytes = buffered.getvalue()
+
+    doc = fitz.open()
+    page, y = None, None
+    for order_number in order_numbers:
+        sku, product_name, product_variation = rng.choice(products)
+        name_lines = wrap(product_name, 22) + wrap(product_variation, 22)
+        height = 12*len(name_lines) + 80
+        if page is None or y + height > 820:
+            page, y = doc.new_page(width=595, height=842), 30
+            if doc.page_count == 1:
+                page.insert_text((252, 50), 'Picking List', fontsize=16, fontname='hebo')
+                page.insert_text((484, 25), f"Print Date:{dt.date.today():%m-%d-%Y}", fontsize=10, fontname='hebo')
+                page.insert_text((504, 46), 'Operator:Sookee', fontsize=10, fontname='hebo')
+                page.insert_text((507, 67), f'Total Product:{len(order_numbers)}', fontsize=10, fontname='hebo')
+                for x, header in [(10, 'SKU'), (171, 'Product Name'), (303, 'Qty'), (336, 'Order ID')]:
+                    page.insert_text((x, 96), header, fontsize=12, fontname='hebo')
+                y = 116
+        page.insert_text((10, y + 11), sku, fontsize=12)
+        for line_no, line in enumerate(name_lines):
+            page.insert_text((171, y + 17 + 12*line_no), line, fontsize=12)
+        page.insert_text((303, y + 17), str(rng.randint(1, 3)), fontsize=12)
+        page.insert_image(fitz.Rect(334, y + 7, 350, y + 23), stream=logo_bytes)
+        page.insert_text((350, y + 21), f'{order_number}(1)', fontsize=12)
+        y += 12*len(name_lines) + 30
+        page.insert_text((10, y), 'Buyer Note: -', fontsize=11, fontname='hebo')
+        page.insert_text((10, y + 19), 'Picking Note: -', fontsize=11, fontname='hebo')
+        y += 49
+    doc.save(file_location)
+    doc.close()
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process & of its largest worker process"""
+    try:
+        import resource
+        scale = 1024 if sys.platform != 'darwin' else 1024*1024     # kB on linux, bytes on mac
+        return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/scale,
+                resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss/scale)
+    except ImportError:     # windows
+        import psutil
+        return psutil.Process().memory_info().peak_wset/1024/1024, 0.0
+
+
+def run_case(tool, folder):
+    """Runs one tool on the inputs in folder, in this process, returns its measurements"""
+    import fitz
+    from Ginee_Assets import assets
+
+    start = time.perf_counter()
+    if tool == 'convert_packing_list':
+        import Ginee_PDF_Converter
+        assets.cache_folder = None          # measures cold renders, not the on-disk cache
+        save_location = Ginee_PDF_Converter.convert_packing_list(open_pdf=False)
+        Ginee_PDF_Converter.shutdown_workers()     # reaped workers count towards peak_rss_mb
+    else:
+        import Ginee_Packing_List
+        with fitz.open(os.path.join(folder, 'Downloads', 'Picking List.pdf')) as doc:
+            Ginee_Packing_List.add_barcode(doc)
+        save_location = os.path.join(folder, 'Ginee', 'Ginee Picking List.pdf')
+    seconds = time.perf_counter() - start
+
+    with fitz.open(save_location) as doc:
+        pages = doc.page_count
+    rss, worker_rss = peak_rss_mb()
+    return {'seconds': round(seconds, 3), 'pages': pages, 'pages_per_sec': round(pages/seconds, 2),
+            'peak_rss_mb': round(rss, 1), 'peak_worker_rss_mb': round(worker_rss, 1),
+            'output_kb': round(os.path.getsize(save_location)/1024, 1)}
+
+
+def benchmark(tool, orders, seed=0):
+    """Generates the inputs of one case & runs it in a fresh process"""
+    with tempfile.TemporaryDirectory(prefix='ginee-benchmark-') as folder:
+        downloads_folder, ginee_folder = os.path.join(folder, 'Downloads'), os.path.join(folder, 'Ginee')
+        os.makedirs(downloads_folder)
+        os.makedirs(ginee_folder)
+        for filename in asset_files:
+            shutil.copy(os.path.join(script_folder, filename), ginee_folder)
+        if tool == 'convert_packing_list':
+            generate_export(os.path.join(downloads_folder, 'export.xlsx'), orders, seed)
+        else:
+            generate_picking_list(os.path.join(downloads_folder, 'Picking List.pdf'), orders, seed)
+
+        env = dict(os.environ, GINEE_DOWNLOADS=downloads_folder, GINEE_FOLDER=ginee_folder)
+        result = subprocess.run([sys.executable, os.path.abspath(__file__), '--case', tool, folder],
+                                env=env, cwd=folder, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"{tool} ({orders} orders) failed:\n{result.stderr[-2000:]}")
+        return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def load_baseline():
+    if os.path.exists(baseline_location):
+        with open(baseline_location) as f:
+            return json.load(f)
+    return {}
+
+
+def main(sizes=SIZES, tools=TOOLS, save_baseline=False):
+    baseline = load_baseline()
+    results = {}
+    print(f"{'case':<30}{'pages':>8}{'pages/s':>10}{'base':>10}{'rss MB':>9}{'workers':>9}{'out KB':>10}")
+    for tool in tools:
+        for orders in sizes:
+            case = f'{tool} {orders}'
+            results[case] = result = benchmark(tool, orders)
+            base = baseline.get('results', {}).get(case)
+            flag = ''
+            if base and result['pages_per_sec']*REGRESSION < base['pages_per_sec']:
+                flag = '  REGRESSION'
+            print(f"{case:<30}{result['pages']:>8}{result['pages_per_sec']:>10}"
+                  f"{base['pages_per_sec'] if base else '-':>10}{result['peak_rss_mb']:>9}"
+                  f"{result['peak_worker_rss_mb']:>9}{result['output_kb']:>10}{flag}")
+
+    if save_baseline or not baseline:
+        baseline = {'time': dt.datetime.now().isoformat(timespec='seconds'), 'python': sys.version.split()[0],
+                    'cpus': os.cpu_count(), 'results': {**baseline.get('results', {}), **results}}
+        with open(baseline_location, 'w') as f:
+            json.dump(baseline, f, indent=1)
+        print(f"Saved baseline to {baseline_location}")
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES)
+    parser.add_argument('--tools', nargs='+', choices=TOOLS, default=TOOLS)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--case', nargs=2, metavar=('TOOL', 'FOLDER'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.case:
+        print(json.dumps(run_case(*args.case)))
+    else:
+        main(args.sizes, args.tools, args.save_baseline)
@@ -0,0 +1,107 @@
+"""Keeps the converters, fonts & images warm in one long-running process, jobs arrive over a local socket
+
+    python Ginee_Daemon.py serve
+    python Ginee_Daemon.py packing_list [export.xlsx]       # newest export in Downloads by default
+    python Ginee_Daemon.py picking_list "Picking List.pdf"
+
+The client converts in its own process while no daemon is listening."""
+import os
+import json
+import time
+import socket
+import argparse
+import webbrowser
+import socketserver
+
+
+DAEMON_ADDRESS = ('127.0.0.1', int(os.getenv('GINEE_DAEMON_PORT', 47819)))
+JOB_TYPES = ['packing_list', 'picking_list']
+
+
+def run_job(job, path=None):
+    """Runs one conversion in this process, returns the output pdf's location"""
+    if job == 'picking_list' and not path:
+        raise ValueError("A picking_list job needs the picking list pdf's path")
+    if job == 'packing_list':
+        import Ginee_PDF_Converter
+        return Ginee_PDF_Converter.convert_packing_list(open_pdf=False, latest_file=path)
+    elif job == 'picking_list':
+        import fitz
+        import Ginee_Packing_List
+        with fitz.open(path) as doc:
+            return Ginee_Packing_List.add_barcode(doc)
+    raise ValueError(f"Unknown job {job}, expected one of {JOB_TYPES}")
+
+
+def warm_up():
+    """Imports both converters, loads their assets & starts the worker processes before the first job"""
+    import Ginee_PDF_Converter
+    import Ginee_Packing_List
+    from Ginee_Assets import assets
+    Ginee_PDF_Converter.warm_up()
+    assets.image_bytes(Ginee_Packing_List.package_icon_location, pixels=Ginee_Packing_List.PACKAGE_ICON_PIXELS)
+    if Ginee_PDF_Converter.WORKERS > 1:
+        workers = Ginee_PDF_Converter.WORKERS
+        list(Ginee_PDF_Converter.get_executor(workers).map(Ginee_PDF_Converter.warm_up, range(workers)))
+
+
+class JobHandler(socketserver.StreamRequestHandler):
+    """Reads one json line {'job': ..., 'path': ...}, answers {'output': ..., 'ms': ...} or {'error': ...}"""
+
+    def handle(self):
+        request = json.loads(self.rfile.readline())
+        start = time.perf_counter()
+        print(f"JOB {request.get('job')} {request.get('path') or ''}")
+        try:
+            response = {'output': run_job(request['job'], request.get('path'))}
+        except Exception as e:
+            print(e)
+            response = {'error': f"{type(e).__name__}: {e}"}
+        response['ms'] = round((time.perf_counter() - start)*1000, 1)
+        self.wfile.write((json.dumps(response) + '\n').encode())
+
+
+class DaemonServer(socketserver.TCPServer):
+    allow_reuse_address = True      # single threaded, jobs run one at a time
+
+
+def serve(address=DAEMON_ADDRESS):
+    start = time.perf_counter()
+    warm_up()
+    with DaemonServer(address, JobHandler) as server:
+        print(f"Ginee daemon warm in {time.perf_counter() - start:.1f}s, listening on {address[0]}:{address[1]}")
+        server.serve_forever()
+
+
+def submit(job, path=None, address=DAEMON_ADDRESS, timeout=600):
+    """Sends a job to the daemon & returns the output pdf's location"""
+    path = path and os.path.abspath(path)
+    try:
+        connection = socket.create_connection(address, timeout=timeout)
+    except OSError:
+        print("No Ginee daemon listening, converting in this process")
+        return run_job(job, path)
+
+    with connection, connection.makefile('rwb') as stream:
+        stream.write((json.dumps({'job': job, 'path': path}) + '\n').encode())
+        stream.flush()
+        response = json.loads(stream.readline())
+    if 'error' in response:
+        raise RuntimeError(response['error'])
+    print(f"Converted by the daemon in {response['ms']} ms")
+    return response['output']
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('job', choices=['serve'] + JOB_TYPES)
+    parser.add_argument('path', nargs='?')
+    parser.add_argument('--no-open', action='store_true', help="prints the output's location without opening it")
+    args = parser.parse_args()
+    if args.job == 'serve':
+        serve()
+    else:
+        output = submit(args.job, args.path)
+        print(output)
+        if not args.no_open:
+            webbrowser.open(output)
@@ -0,0 +1,90 @@
+import os
+import json
+import time
+import queue
+import atexit
+import logging
+import datetime as dt
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+
+REPEAT_INTERVAL = 60        # seconds an identical message is counted instead of written
+log_formatter = logging.Formatter('%(asctime)s:%(levelname)s:%(name)s:%(message)s', datefmt='%d-%b-%y %H:%M:%S')
+
+
+class CollapsingQueueListener(QueueListener):
+    """Writes records on its own thread, collapsing repeats of an identical message into one summary count
+
+    The first record of a message is written, later ones with the same logger, level & text are counted
+    until REPEAT_INTERVAL passes or a record with flush_repeats=True arrives, e.g. the end of a conversion."""
+
+    def __init__(self, log_queue, *handlers, interval=REPEAT_INTERVAL):
+        super().__init__(log_queue, *handlers, respect_handler_level=True)
+        self.interval = interval
+        self.repeats = {}       # (logger, level, formatted message): [first record's time, repeats counted]
+
+    def handle(self, record):
+        if getattr(record, 'flush_repeats', False):
+            self.flush_repeats()
+        else:
+            self.flush_repeats(expired_only=True)
+        key = (record.name, record.levelno, record.getMessage())
+        if key in self.repeats:
+            self.repeats[key][1] += 1
+            return
+        self.repeats[key] = [record.created, 0]
+        super().handle(record)
+
+    def flush_repeats(self, expired_only=False):
+        now = time.time()
+        for key, (first, count) in list(self.repeats.items()):
+            if expired_only and now - first < self.interval:
+                continue
+            del self.repeats[key]
+            if count:
+                name, level, message = key
+                super().handle(logging.makeLogRecord({
+                    'name': name, 'levelno': level, 'levelname': logging.getLevelName(level),
+                    'msg': f"'{message}' repeated {count} more times in {now - first:.0f}s"}))
+
+    def stop(self):
+        super().stop()
+        self.flush_repeats()
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        return json.dumps({'time': dt.datetime.fromtimestamp(record.created).isoformat(timespec='seconds'),
+                           'logger': record.name, **record.conversion})
+
+
+def setup_logging(name, log_location, json_location=None):
+    """Logs to the console & log_location from a background thread, so callers never wait on the disk
+
+    json_location, or GINEE_JSON_LOG, also writes every log_conversion as one json line"""
+    json_location = json_location or os.getenv('GINEE_JSON_LOG')
+    stream_handler = logging.StreamHandler()
+    rotating_file_handler = RotatingFileHandler(filename=log_location, mode='a', maxBytes=5000000, backupCount=1)
+    rotating_file_handler.setFormatter(log_formatter)
+    handlers = [stream_handler, rotating_file_handler]
+    if json_location:
+        json_handler = logging.FileHandler(json_location, mode='a')
+        json_handler.setFormatter(JsonFormatter())
+        json_handler.addFilter(lambda record: hasattr(record, 'conversion'))
+        handlers.append(json_handler)
+
+    log_queue = queue.SimpleQueue()
+    listener = CollapsingQueueListener(log_queue, *handlers)
+    listener.start()
+    atexit.register(listener.stop)      # writes the remaining records & repeat counts
+
+    logger = logging.getLogger(name)
+    logger.setLevel(logging.DEBUG)
+    logger.addHandler(QueueHandler(log_queue))
+    return logger
+
+
+def log_conversion(logger, **details):
+    """Logs one conversion's summary e.g. file, orders, pages & duration_ms, ending its repeat counts"""
+    logger.info(', '.join(f"{key}: {value}" for key, value in details.items()),
+                extra={'conversion': details, 'flush_repeats': True})
@@ -0,0 +1,224 @@
+import os
+import json
+import math
+import sqlite3
+import datetime as dt
+import requests
+from requests.adapters import HTTPAdapter
+from contextlib import closing
+from threading import Thread
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from Ginee_Timing import timer, timed
+
+
+# File locations
+onedrive_location = os.path.join(os.getenv('USERPROFILE'), 'OneDrive', 'Shared Files - Shop', 'Python Scripts')
+database_location = os.path.join(onedrive_location, 'Ginee', 'ginee_orders.db')
+
+# Order list backend used by the seller.ginee.com order iframe
+GINEE_URL = 'https://seller.ginee.com'
+LOGIN_PATH = '/api/iam/user/login'
+ORDER_LIST_PATH = '/api/oms/order/list'
+PAGE_SIZE = 100
+WORKERS = 8
+FULL_SYNC_INTERVAL = dt.timedelta(hours=6)     # full reconciliation catches orders leaving PAID
+
+SYNC_STATE_TABLE = """CREATE TABLE IF NOT EXISTS sync_state (
+                        store TEXT PRIMARY KEY, last_order_id TEXT, last_order_time TEXT, last_full_sync TIMESTAMP);"""
+LEFT_PAID_TABLE = """CREATE TABLE IF NOT EXISTS left_paid (
+                        ginee_order_id TEXT PRIMARY KEY, left_at TIMESTAMP);"""
+
+
+def recording_name(path, payload):
+    """File name of a recorded response, shared by the recorder & the replay server"""
+    name = path.strip('/').replace('/', '_')
+    if 'page' in payload:
+        name += f"_{payload.get('orderStatus', '')}_{payload['page']}"
+    return name + '.json'
+
+
+def order_store(order):
+    return 'Sookee' if 'Sookee Store' in order.get('shopName', '') else 'Edge'
+
+
+def order_time(order):
+    return str(order.get('createTime', ''))
+
+
+class OrderSync():
+    """Syncs the PAID orders into sqlite over a pooled keep-alive http session, no browser needed"""
+
+    def __init__(self, base_url=GINEE_URL, database_location=database_location, workers=WORKERS, record_folder=None):
+        self.base_url = base_url
+        self.database_location = database_location
+        self.workers = workers
+        self.record_folder = record_folder      # saves every response for the replay server
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({'Accept': 'application/json'})
+        self.logged_in = False
+
+    def post(self, path, payload):
+        response = self.session.post(self.base_url + path, json=payload, timeout=30)
+        response.raise_for_status()
+        data = response.json()
+        if self.record_folder:
+            os.makedirs(self.record_folder, exist_ok=True)
+            with open(os.path.join(self.record_folder, recording_name(path, payload)), 'w') as f:
+                json.dump(data, f)
+        if data.get('code') != 'SUCCESS':
+            raise RuntimeError(f"{path} failed: {data.get('message')}")
+        return data['data']
+
+    @timed('login')
+    def login(self):
+        print("LOGGING IN TO GINEE (HTTP)")
+        with closing(sqlite3.connect(self.database_location)) as conn:
+            ginee_email, ginee_password = conn.execute(
+                "SELECT user, password FROM credentials WHERE platform = 'Ginee';").fetchone()
+        data = self.post(LOGIN_PATH, {'email': ginee_email, 'password': ginee_password})
+        # session cookies are kept by the session, some responses also carry a bearer token
+        if isinstance(data, dict) and data.get('token'):
+            self.session.headers['Authorization'] = f"Bearer {data['token']}"
+        self.logged_in = True
+        print("\tSucessfully logged in.")
+
+    @timed('fetch_page')
+    def fetch_page(self, page, status='PAID'):
+        return self.post(ORDER_LIST_PATH, {'page': page, 'size': PAGE_SIZE, 'orderStatus': status})
+
+    def fetch_orders(self, status='PAID'):
+        """Fetches the first page, then the remaining pages concurrently"""
+        first_page = self.fetch_page(0, status)
+        total_pages = math.ceil(first_page['total']/PAGE_SIZE)
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            pages = [first_page] + list(executor.map(lambda page: self.fetch_page(page, status),
+                                                     range(1, total_pages)))
+        return [order for page in pages for order in page['content']]
+
+    def fetch_new_orders(self, known_order_ids, high_water_marks, status='PAID'):
+        """Pages from the newest order until a page holds only known orders or ones older than their store's mark"""
+        orders, page = [], 0
+        while True:
+            data = self.fetch_page(page, status)
+            orders += data['content']
+            if all(order['orderId'] in known_order_ids
+                   or order_time(order) and order_time(order) <= high_water_marks.get(order_store(order), '')
+                   for order in data['content']):
+                break
+            page += 1
+            if page*PAGE_SIZE >= data['total']:
+                break
+        return orders
+
+    def sync(self, lookup=None, full=None):
+        """Upserts new PAID orders into the orders table, returns the synced rows
+
+        full re-reads every page & marks orders that left PAID, by default every FULL_SYNC_INTERVAL"""
+        if not self.logged_in:
+            self.login()
+
+        with closing(sqlite3.connect(self.database_location, isolation_level=None)) as conn:
+            conn.execute(SYNC_STATE_TABLE)
+            conn.execute(LEFT_PAID_TABLE)
+            state = {store: (last_order_time, last_full_sync) for store, last_order_time, last_full_sync
+                     in conn.execute("SELECT store, last_order_time, last_full_sync FROM sync_state;")}
+            if full is None:
+                last_full_syncs = [last_full_sync for _, last_full_sync in state.values()]
+                full = not last_full_syncs or None in last_full_syncs or \
+                       dt.datetime.now() - dt.datetime.fromisoformat(min(last_full_syncs)) > FULL_SYNC_INTERVAL
+
+            print(f"SYNCING GINEE ORDER IDs ({'FULL' if full else 'INCREMENTAL'})")
+            if full:
+                orders = self.fetch_orders()
+            else:
+                known_order_ids = {ginee_order_id for ginee_order_id, in conn.execute(
+                    "SELECT ginee_order_id FROM orders WHERE ginee_order_id NOT IN (SELECT ginee_order_id FROM left_paid);")}
+                high_water_marks = {store: last_order_time or '' for store, (last_order_time, _) in state.items()}
+                orders = self.fetch_new_orders(known_order_ids, high_water_marks)
+
+            rows = [(order['orderId'], order['externalOrderId'], dt.datetime.now(), order_store(order))
+                    for order in orders]
+            conn.execute("BEGIN;")
+            conn.executemany("""INSERT OR IGNORE INTO orders
+                                VALUES (?, ?, ?, ?);""", rows)
+
+            # Per-store high-water mark of the newest order seen
+            newest = {}
+            for order in orders:
+                store = order_store(order)
+                if store not in newest or order_time(order) > order_time(newest[store]):
+                    newest[store] = order
+            for store, order in newest.items():
+                conn.execute("""INSERT INTO sync_state (store, last_order_id, last_order_time) VALUES (?, ?, ?)
+                                ON CONFLICT (store) DO UPDATE SET last_order_id = excluded.last_order_id,
+                                last_order_time = excluded.last_order_time
+                                WHERE excluded.last_order_time > IFNULL(sync_state.last_order_time, '');""",
+                             (store, order['orderId'], order_time(order)))
+
+            if full:
+                paid_order_ids = [(order['orderId'],) for order in orders]
+                conn.execute("CREATE TEMP TABLE paid (ginee_order_id TEXT PRIMARY KEY);")
+                conn.executemany("INSERT OR IGNORE INTO paid VALUES (?);", paid_order_ids)
+                conn.execute("DELETE FROM left_paid WHERE ginee_order_id IN (SELECT ginee_order_id FROM paid);")
+                left = conn.execute("""INSERT OR IGNORE INTO left_paid
+                                       SELECT ginee_order_id, ? FROM orders
+                                       WHERE ginee_order_id NOT IN (SELECT ginee_order_id FROM paid);""",
+                                    (dt.datetime.now(),)).rowcount
+                conn.execute("DROP TABLE paid;")
+                conn.executemany("""INSERT INTO sync_state (store, last_full_sync) VALUES (?, ?)
+                                    ON CONFLICT (store) DO UPDATE SET last_full_sync = excluded.last_full_sync;""",
+                                 [(store, dt.datetime.now().isoformat()) for store in set(state) | set(newest)])
+                print(f"\t{left} orders left PAID.")
+            conn.execute("COMMIT;")
+
+        if lookup is not None:
+            if full:
+                lookup.refresh()
+            else:
+                lookup.add(rows)
+        print(f"\tSynced {len(rows)} orders.")
+        return rows
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    """Answers posts with responses saved by OrderSync(record_folder=...)"""
+    record_folder = None
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        payload = json.loads(body or b'{}')
+        file_location = os.path.join(self.record_folder, recording_name(urlsplit(self.path).path, payload))
+        if not os.path.exists(file_location):
+            self.send_error(404)
+            return
+        with open(file_location, 'rb') as f:
+            response = f.read()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_recordings(record_folder, port=0):
+    """Starts a local stub server replaying recorded responses, returns (server, base url)"""
+    handler = type('RecordingHandler', (ReplayHandler,), {'record_folder': record_folder})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+if __name__ == '__main__':
+    rows = OrderSync().sync()
+    timer.report('sync', orders=len(rows))
+    # OrderSync(record_folder='Ginee Recordings').sync()
+    # server, base_url = serve_recordings('Ginee Recordings')
+    # OrderSync(base_url=base_url).sync()
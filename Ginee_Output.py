@@ -0,0 +1,53 @@
+import os
+import math
+import time
+import shutil
+import subprocess
+import webbrowser
+from Ginee_Timing import stage, timed
+
+
+PRINTER = 'ZDesigner GK888t'
+PRINTER_DPI = 203       # Zebra GK888t
+SPOOLER = 'windows' if os.name == 'nt' else 'lp'     # 'file' copies pdfs into spool_folder instead
+spool_folder = os.path.join(os.path.expanduser('~'), 'Downloads', 'Ginee Spool')
+# 'print' deflates every stream, drops unused & duplicate objects (e.g. artwork repeated by worker chunks)
+# & cleans the content streams, 'fast' skips the duplicate search for the quickest compressed save
+SAVE_PROFILES = {'print': {'garbage': 4, 'deflate': True, 'clean': True},
+                 'fast': {'garbage': 1, 'deflate': True},
+                 'default': {}}
+SAVE_PROFILE = 'print'
+
+
+def print_pixels(points, dpi=PRINTER_DPI):
+    """Pixels needed to print a length in points (1/72 inch) at the printer's resolution"""
+    return math.ceil(points*dpi/72)
+
+
+def save_pdf(doc, location, profile=SAVE_PROFILE):
+    """Saves doc with a save profile, returns the output size & save time"""
+    start = time.perf_counter()
+    with stage('save'):
+        doc.save(location, **SAVE_PROFILES[profile])
+    return {'output_kb': round(os.path.getsize(location)/1024, 1),
+            'save_ms': round((time.perf_counter() - start)*1000, 1), 'save_profile': profile}
+
+
+@timed('spool_pdf')
+def spool_pdf(pdf_location, printer=PRINTER, spool_folder=spool_folder):
+    """Sends a pdf straight to the print spooler, without a print preview"""
+    if SPOOLER == 'lp':
+        subprocess.run(['lp', '-d', printer, pdf_location], check=True)
+    elif SPOOLER == 'windows':
+        os.startfile(pdf_location, 'printto', f'"{printer}"')
+    else:   # file-backed spooler for testing
+        os.makedirs(spool_folder, exist_ok=True)
+        shutil.copy(pdf_location, spool_folder)
+
+
+def open_pdf(pdf_location):
+    webbrowser.open(pdf_location)
+
+
+# Called with every finished pdf's location, e.g. convert_packing_list(hook='print')
+OUTPUT_HOOKS = {'open': open_pdf, 'print': spool_pdf}
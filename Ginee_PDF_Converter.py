@@ -2,38 +2,77 @@ import os
 import re
 import io
 import glob
+import math
 import time
 import json
 import fitz
-import qrcode
-import barcode
-from barcode.writer import ImageWriter
-import pandas as pd
-import numpy as np
+import atexit
 import datetime as dt
-from PIL import Image, ImageFont, ImageDraw
+import hashlib
 import textwrap
-import webbrowser
+import shutil
+import multiprocessing
+import importlib.util
+import itertools
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from Ginee_Assets import assets
+from Ginee_Timing import timer, stage, timed
+from Ginee_Output import save_pdf, print_pixels, SAVE_PROFILE, SAVE_PROFILES, OUTPUT_HOOKS
 
+# Optional engines are only looked up here, pandas imports them on first use
+# python_calamine, a rust excel reader, is several times faster than openpyxl; pyarrow stores the export cache
+EXCEL_ENGINE = 'calamine' if importlib.util.find_spec('python_calamine') else 'openpyxl'
+EXPORT_CACHE_FORMAT = 'parquet' if importlib.util.find_spec('pyarrow') else 'pickle'
 
-# Folder locations
-downloads_folder = os.path.join(os.environ.get('HOMEPATH'), 'Downloads')
-onedrive_folder = os.path.join(os.getenv('HOMEPATH'), 'OneDrive', 'Shared Files - Shop', 'Python Scripts', 'Ginee')
 
-# Thank you image file
-with Image.open(os.path.join(onedrive_folder, 'ty for your purchase.jpg'), 'r') as ty_image:
-    imgByteArr = io.BytesIO()
-    # ty_image = ty_image.rotate(270)
-    ty_image.save(imgByteArr, format='PNG')
-    ty_image_bytes = imgByteArr.getvalue()
+# Folder locations, GINEE_DOWNLOADS & GINEE_FOLDER override them e.g. for Ginee_Benchmark on Linux
+downloads_folder = os.getenv('GINEE_DOWNLOADS') or os.path.join(os.environ.get('HOMEPATH'), 'Downloads')
+onedrive_folder = os.getenv('GINEE_FOLDER') or \
+                  os.path.join(os.getenv('HOMEPATH'), 'OneDrive', 'Shared Files - Shop', 'Python Scripts', 'Ginee')
+render_cache_folder = os.path.join(downloads_folder, 'Ginee Render Cache')    # reprints skip rasterization
+export_cache_folder = os.path.join(downloads_folder, 'Ginee Export Cache')    # reruns skip parsing the export
+stream_folder = os.path.join(onedrive_folder, 'Ginee Packing List Chunks')    # stream=True writes a subfolder per batch
+
+RENDER_MODE = 'vector'      # 'vector' writes pdf text, 'raster' inserts text drawn by PIL
+WORKERS = os.cpu_count()    # processes rendering packing slips, 1 renders in this process
+CHUNK_SIZE = 50             # orders per worker chunk & per streamed pdf
+EXPORT_CACHE_SIZE = 10      # parsed exports kept on disk
+STREAM_BATCHES = 3          # streamed batch folders kept, older ones are removed unless still open
+RENDER_CACHE_SIZE = 5000    # rendered pngs kept on disk, a few days of exports
+CSV_CHUNK_SIZE = 10000      # rows per chunk when streaming a csv export
+# Only the columns used are read, text columns as str so numeric order ids & skus stay text
+export_columns = {'NO.': 'float64', 'Order ID': str, 'Buyer Name': str, 'Product Name': str, 'Product Variation': str,
+                  'SKU': str, 'Inventory SKU': str, 'Qty': 'float64', 'Product Status': str, 'Buyer Note': str}
+vector_fonts = {'libsans': 'LiberationSans-Regular.ttf', 'libsans-bold': 'LiberationSans-Bold.ttf',
+                'marck': 'MarckScript-Regular.ttf'}
+
+# Order details layout in pixels of the 596 wide image, text widths are measured with the font
+ORDER_DETAILS_TOP = 60          # first row's baseline, below the headers
+ORDER_DETAILS_BOTTOM = 790      # last baseline of a picking list page, above the print date
+SLIP_DETAILS_BOTTOM = 290       # last baseline of a packing slip's 596x300 details
+PRODUCT_NAME_WIDTH = 280        # product name column 10 - 290
+VARIATION_WIDTH = 250           # variation & sku column 300 - 550
+ROW_GAP = 10
+
+# Thank you image file, loaded by assets on first use
+ty_image_location = os.path.join(onedrive_folder, 'ty for your purchase.jpg')
+assets.cache_folder = render_cache_folder
+
+# Worker processes are started once & kept warm between conversions
+executor = None
 
+
+@assets.cached('text')
+@timed('draw_text')
 def draw_text(text, size, font_size, wraptext=None):
+    from PIL import Image, ImageDraw
     if wraptext:
         lines = textwrap.wrap(text, width=wraptext)
         text = '\n'.join(lines)
 
     imgByteArr = io.BytesIO()
-    font = ImageFont.truetype(os.path.join(onedrive_folder, 'LiberationSans-Regular.ttf'), size=font_size)
+    font = assets.font(os.path.join(onedrive_folder, 'LiberationSans-Regular.ttf'), font_size)
     text_image = Image.new(mode='RGB', size=size, color='#ffffff')
     draw = ImageDraw.Draw(im=text_image)
     draw.text(xy=(size[0]/2, size[1]/2), text=text, font=font, fill='black', anchor='mm', align='left')
@@ -43,7 +82,7 @@ def draw_text(text, size, font_size, wraptext=None):
     return imgByteArr.getvalue()
 
 
-def draw_greetings(customer_name):
+def format_greeting_name(customer_name):
     formatted_customer_name = re.sub(' [a-zA-Z]?\.* ', ' ', customer_name).strip().split('/')[0]
     print(formatted_customer_name)
     splitted_customer_name = formatted_customer_name.split(' ')
@@ -51,8 +90,16 @@ def draw_greetings(customer_name):
         joined_names = ' '.join(splitted_customer_name[:i])
         if len(joined_names) <= 12:
             greeting_name = joined_names
+    return greeting_name
+
+
+@assets.cached('greeting')
+@timed('draw_greetings')
+def draw_greetings(customer_name):
+    from PIL import Image, ImageDraw
+    greeting_name = format_greeting_name(customer_name)
     imgByteArr = io.BytesIO()
-    font = ImageFont.truetype(font=os.path.join(onedrive_folder, 'MarckScript-Regular.ttf'), size=72)   # customized font
+    font = assets.font(os.path.join(onedrive_folder, 'MarckScript-Regular.ttf'), 72)   # customized font
     greeting_image = Image.new(mode='RGB', size=(640, 104), color='#ffffff')
     draw = ImageDraw.Draw(im=greeting_image)
     draw.text(xy=(320, 50), text=f"Hi {greeting_name.title()}!", font=font, fill='black', anchor='mm')
@@ -61,24 +108,99 @@ def draw_greetings(customer_name):
     return imgByteArr.getvalue()
 
 
-def generate_barcode(text, type, barcode_type='Code39', write_text=True):
-    """Generates barcode in bytes"""
+@assets.cached('barcode')
+@timed('generate_barcode')
+def generate_barcode(text, type, barcode_type='Code39', write_text=True, pixels=None):
+    """Generates barcode in bytes, pixels sizes a qrcode to the printer's resolution as a 1-bit image"""
     buffered = io.BytesIO()
     if type == 'barcode':
+        import barcode
+        from barcode.writer import ImageWriter
         barcode.base.Barcode.default_writer_options['write_text'] = write_text
         barcode.generate(barcode_type, text, writer=ImageWriter(), output=buffered)
     elif type == 'qrcode':
+        import qrcode
         qr = qrcode.QRCode(box_size=20)
         qr.add_data(text)
-        img = qr.make_image(back_color = 'Transparent')
-        img.save(buffered, format='PNG', transperancy=0, fill=(255, 0, 0))
+        if pixels:      # smallest box size still printing every module at PRINTER_DPI
+            qr.make(fit=True)
+            qr.box_size = math.ceil(pixels/(qr.modules_count + 2*qr.border))
+            img = qr.make_image()
+            img.save(buffered, format='PNG')
+        else:
+            img = qr.make_image(back_color = 'Transparent')
+            img.save(buffered, format='PNG', transperancy=0, fill=(255, 0, 0))
     return buffered.getvalue()
         
 
-def draw_order_details(order_details, size=(596, 300)):
+def text_length(text, font_size=16):
+    """Width in pixels of text in the regular font, measured once per word"""
+    return assets.text_length(os.path.join(onedrive_folder, vector_fonts['libsans']), text, font_size)
+
+
+def fit_text(text, width):
+    """Cuts text to the characters that fit in width, in one pass over cached character widths"""
+    text_width = 0
+    for i, character in enumerate(text):
+        text_width += text_length(character)
+        if text_width > width:
+            return text[:i]
+    return text
+
+
+def wrap_text(text, width, max_lines=None):
+    """Greedy word wrap on measured word widths, words longer than a line are cut"""
+    space = text_length(' ')
+    lines, line, line_width = [], '', 0
+    for word in text.split():
+        word_width = text_length(word)
+        if line and line_width + space + word_width <= width:
+            line, line_width = f'{line} {word}', line_width + space + word_width
+            continue
+        if line:
+            lines.append(line)
+        if word_width > width:
+            word = fit_text(word, width)
+            word_width = sum(text_length(character) for character in word)
+        line, line_width = word, word_width
+    if line:
+        lines.append(line)
+    return lines[:max_lines]
+
+
+def layout_order_details(order_details, bottom=ORDER_DETAILS_BOTTOM):
+    """Measures every row once & splits the rows into pages before anything is drawn
+
+    Returns pages of (baseline y, product name lines, variation & sku lines, qty) in pixels"""
+    font = assets.font(os.path.join(onedrive_folder, 'LiberationSans-Regular.ttf'), 16)
+    line_spacing = font.getbbox('A')[3] + 4     # same spacing as PIL's multiline text
+    pages, rows, y = [], [], ORDER_DETAILS_TOP
+    # column-oriented pass, avoids building a Series per row like iterrows
+    columns = zip(order_details['Product Name'].values, order_details['Product Variation'].values,
+                  order_details['SKU'].values, order_details['Qty'].values)
+    for product, variation, sku, qty in columns:
+        product_name = wrap_text(product.split('//')[0], PRODUCT_NAME_WIDTH, max_lines=3)
+        variation_sku = [fit_text(re.sub('.*:', '', option), VARIATION_WIDTH)
+                         for option in variation.split(',') if option != ''][:2]
+        variation_sku.append(fit_text(str(sku), VARIATION_WIDTH))
+        lines = max(len(product_name), len(variation_sku))
+        if rows and y + (lines - 1)*line_spacing > bottom:      # last line would pass the bottom
+            pages.append(rows)
+            rows, y = [], ORDER_DETAILS_TOP
+        rows.append((y, product_name, variation_sku, qty))
+        y += lines*line_spacing + ROW_GAP
+    if rows:
+        pages.append(rows)
+    return pages
+
+
+@timed('draw_order_details')
+def draw_order_details(rows, size=(596, 300)):
+    """Draws one page of laid out rows from layout_order_details"""
+    from PIL import Image, ImageDraw
     imgByteArr = io.BytesIO()           # pixel dimensions and font sizes are doubled to avoid pixelated
-    font = ImageFont.truetype(font=os.path.join(onedrive_folder, 'LiberationSans-Regular.ttf'), size=16)
-    bold_font = ImageFont.truetype(os.path.join(onedrive_folder, 'LiberationSans-Bold.ttf'), 20)
+    font = assets.font(os.path.join(onedrive_folder, 'LiberationSans-Regular.ttf'), 16)
+    bold_font = assets.font(os.path.join(onedrive_folder, 'LiberationSans-Bold.ttf'), 20)
     text_image = Image.new(mode='RGB', size=size, color='#ffffff')
     draw = ImageDraw.Draw(im=text_image)
     # drawing headers
@@ -88,85 +210,367 @@ def draw_order_details(order_details, size=(596, 300)):
     draw.text(xy=(550, 24), text=headers[2], font=bold_font, fill='black', anchor='ls')
     draw.line((10, 30, 586, 30), fill='black', width=1)
     # drawing order details
-    total_products, total_lines = 0, 3
-    for index, order in order_details.iterrows():
-        product_name = textwrap.wrap(order['Product Name'].split('//')[0], width=32)
-        product_name_lines = '\n'.join(product_name[:3])
-        variation_sku = [re.sub('.*:', '', option) for option in order['Product Variation'].split(',') if option != ''][:2]
-        variation_sku.append(order['SKU'][:33])
-        variation_sku_lines = '\n'.join(variation_sku)
-        draw.text(xy=(10, 20*total_lines), text=product_name_lines, font=font, fill='black', anchor='ls')
-        draw.text(xy=(300, 20*total_lines), text=variation_sku_lines, font=font, fill='black', anchor='ls')
-        draw.text(xy=(560, 20*total_lines), text=str(int(order['Qty'])), font=font, fill='black', anchor='ls')
-        total_lines += len(max(product_name[:3], variation_sku, key=len)) + 0.5
-        total_products += 1
-        if total_lines >= 40:
-            break
+    for y, product_name, variation_sku, qty in rows:
+        draw.text(xy=(10, y), text='\n'.join(product_name), font=font, fill='black', anchor='ls')
+        draw.text(xy=(300, y), text='\n'.join(variation_sku), font=font, fill='black', anchor='ls')
+        draw.text(xy=(560, y), text=str(int(qty)), font=font, fill='black', anchor='ls')
     text_image.save(imgByteArr, format='PNG')
-    return imgByteArr.getvalue(), total_products
+    return imgByteArr.getvalue()
 
 
-def convert_packing_list():
-    """Converts exported template excel from Ginee to customized Packing & Picking List in PDF"""
-    print("Starting Ginee Packing List Converter")
-    new_doc = fitz.open()
+def insert_vector_fonts(page):
+    """Registers the bundled fonts on page, the font files are embedded once per document"""
+    for fontname, filename in vector_fonts.items():
+        page.insert_font(fontname=fontname, fontfile=os.path.join(onedrive_folder, filename))
+
+
+def write_text(page, rect, text, size, font_size, fontname='libsans'):
+    """Vector counterpart of draw_text, centers text as if drawn on a size pixel image scaled into rect"""
+    rect = fitz.Rect(rect)
+    font = assets.pdf_font(os.path.join(onedrive_folder, vector_fonts[fontname]))
+    text = str(text)
+    fontsize = font_size * min(rect.width/size[0], rect.height/size[1])
+    text_length = font.text_length(text, fontsize)
+    if text_length > rect.width:        # shrinks long text instead of clipping it
+        fontsize, text_length = fontsize*rect.width/text_length, rect.width
+    x = rect.x0 + (rect.width - text_length)/2
+    y = rect.y0 + rect.height/2 + fontsize*(font.ascender + font.descender)/2     # middle anchor to baseline
+    page.insert_text((x, y), text, fontname=fontname, fontsize=fontsize)
+
+
+def write_greetings(page, rect, customer_name):
+    greeting_name = format_greeting_name(customer_name)
+    write_text(page, rect, f"Hi {greeting_name.title()}!", (640, 104), 72, fontname='marck')
+
+
+@timed('write_order_details')
+def write_order_details(page, rect, rows, size=(596, 300)):
+    """Vector counterpart of draw_order_details, pixel coordinates are scaled into rect"""
+    rect = fitz.Rect(rect)
+    scale = rect.width/size[0]
+    font = assets.font(os.path.join(onedrive_folder, 'LiberationSans-Regular.ttf'), 16)
+    line_spacing = (font.getbbox('A')[3] + 4)*scale     # same spacing as PIL's multiline text
+
+    def write(x, y, lines, fontname='libsans', font_size=16):
+        for i, line in enumerate(lines):
+            point = (rect.x0 + x*scale, rect.y0 + y*scale + i*line_spacing)
+            page.insert_text(point, line, fontname=fontname, fontsize=font_size*scale)
+
+    # writing headers
+    headers = ['Product Name', 'Variation Name', 'Qty']
+    write(10, 24, [headers[0]], 'libsans-bold', 20)
+    write(300, 24, [headers[1]], 'libsans-bold', 20)
+    write(550, 24, [headers[2]], 'libsans-bold', 20)
+    page.draw_line((rect.x0 + 10*scale, rect.y0 + 30*scale), (rect.x0 + 586*scale, rect.y0 + 30*scale), width=scale)
+    # writing order details
+    for y, product_name, variation_sku, qty in rows:
+        write(10, y, product_name)
+        write(300, y, variation_sku)
+        write(560, y, [str(int(qty))])
+
+
+@timed('insertImage')
+def insert_image(page, rect, **kwargs):
+    return page.insert_image(rect, **kwargs)
+
+
+@timed('add_order_page')
+def add_order_page(new_doc, order, render_mode=RENDER_MODE, image_xrefs=None):
+    """Adds an a6 packing slip page for a single order's rows
+
+    image_xrefs is shared by the pages of new_doc so the thank you image is embedded once"""
+    image_xrefs = {} if image_xrefs is None else image_xrefs
+    # creates page with a6 portrait
+    a6_format = fitz.paper_rect('a6')
+    new_page = new_doc.new_page(width = a6_format.width, height = a6_format.height)  # w, h = (298.0, 420.0)
+    vector = render_mode == 'vector'
+    if vector:
+        insert_vector_fonts(new_page)
+    # inputs greeting & ty image
+    if vector:
+        write_greetings(new_page, (0, 20, 298, 70), customer_name=order['Buyer Name'].values[0])
+    else:
+        greeting_name_img = draw_greetings(customer_name=order['Buyer Name'].values[0])
+        insert_image(new_page, (0, 20, 298, 70), stream=greeting_name_img, overlay=True)
+    with stage('insertImage'):
+        assets.insert_image(new_page, (0, 70, 298, 260), ty_image_location, image_xrefs)
+    # insert order number & barcode
+    order_number = order['Order ID'].values[0]
+    barcode = generate_barcode(text=order_number, type='qrcode', pixels=print_pixels(38))
+    if vector:
+        write_text(new_page, (5, 3, 80, 20), order_number, (120, 30), 12)
+    else:
+        insert_image(new_page, (5, 3, 80, 20), stream=draw_text(order_number, (120, 30), 12))
+    insert_image(new_page, (255, 0, 293, 33), stream=barcode)
+    # draws order details, only the rows fitting the slip
+    rows = layout_order_details(order, bottom=SLIP_DETAILS_BOTTOM)[0]
+    if vector:
+        write_order_details(new_page, (0, 270, 298, 420), rows)
+    else:
+        insert_image(new_page, (0, 270, 298, 420), stream=draw_order_details(rows))
+    # finally, inputs buyer note
+    if all(order['Buyer Note'].notnull()):
+        buyers_note = f"Buyer's Note: {order['Buyer Note'].values[0]}"
+        if vector:
+            write_text(new_page, (5, 401, 140, 418), buyers_note, (300, 30), 12)
+        else:
+            insert_image(new_page, (5, 401, 140, 418), stream=draw_text(buyers_note, (300, 30), 12))
+    return new_page
+
 
-    # Finding latest downloaded excel
-    list_of_excels = glob.glob(os.path.join(downloads_folder, '*.xlsx'))
-    latest_file = max(list_of_excels, key=os.path.getctime)
-    df = pd.read_excel(latest_file)
-    df.fillna({'Product Variation': ''}, inplace=True)
+def paid_rows(df):
     df = df[df['Product Status'] == 'Paid']                # filters out cancelled items
+    return df.fillna({'Product Variation': ''})
+
+
+def read_export(file_location):
+    """Reads the 'Paid' rows of a Ginee excel or csv export, cached on disk per (path, size, mtime)"""
+    import pandas as pd     # imported on first use, it is most of this module's import time
+    file_stat = os.stat(file_location)
+    key = repr((os.path.abspath(file_location), file_stat.st_size, file_stat.st_mtime_ns))
+    cache_location = os.path.join(export_cache_folder,
+                                  f"{hashlib.sha1(key.encode()).hexdigest()}.{EXPORT_CACHE_FORMAT}")
+    if os.path.exists(cache_location):
+        print(f"Loading cached export of {os.path.basename(file_location)}")
+        return pd.read_parquet(cache_location) if EXPORT_CACHE_FORMAT == 'parquet' else pd.read_pickle(cache_location)
+
+    print(f"Reading {os.path.basename(file_location)}")
+    if file_location.endswith('.csv'):
+        # streams the rows, keeping only the paid ones of every chunk
+        chunks = pd.read_csv(file_location, usecols=list(export_columns), dtype=export_columns, chunksize=CSV_CHUNK_SIZE)
+        df = pd.concat([paid_rows(chunk) for chunk in chunks], ignore_index=True)
+    else:
+        df = pd.read_excel(file_location, usecols=list(export_columns), dtype=export_columns, engine=EXCEL_ENGINE)
+        df = paid_rows(df).reset_index(drop=True)
+
+    os.makedirs(export_cache_folder, exist_ok=True)
+    if EXPORT_CACHE_FORMAT == 'parquet':
+        df.to_parquet(cache_location, index=False)
+    else:
+        df.to_pickle(cache_location)
+    # keeps the newest EXPORT_CACHE_SIZE parsed exports
+    cached_exports = sorted(glob.glob(os.path.join(export_cache_folder, '*.*')), key=os.path.getmtime, reverse=True)
+    for cached_export in cached_exports[EXPORT_CACHE_SIZE:]:
+        os.remove(cached_export)
+    return df
+
+
+def group_orders(df):
+    """Groups 'Paid' rows once per order number, ordered by SKU"""
     order_nos = df.sort_values('SKU')['NO.'].unique()      # 1.0, 2.0, 3.0 ... 100.0
+    orders = dict(tuple(df.groupby('NO.', sort=False)))    # single pass instead of a scan per order
+    return [(order_no, orders[order_no]) for order_no in order_nos]
+
+
+def render_orders(orders, render_mode=RENDER_MODE, save_profile=None):
+    """Renders a chunk of (order no., order) into an in-memory pdf, runs in worker processes
 
-    picking_list = {}
-    for order_no in order_nos:
+    save_profile finishes the chunk as a standalone pdf, fonts subset & compressed
+    Returns the pdf bytes, the worker's stage timings & its asset cache counts for the main process"""
+    if multiprocessing.parent_process() is not None:
+        timer.take()        # drops timings a forked worker inherited from the main process
+    start_counts = assets.counts()
+    chunk_doc, image_xrefs = fitz.open(), {}
+    for order_no, order in orders:
         print(f"Processing Order No.: {order_no}")
-        order = df[(df['NO.'] == order_no)]
-        # creates page with a6 portrait
-        a6_format = fitz.paper_rect('a6')
-        new_page = new_doc.newPage(width = a6_format.width, height = a6_format.height)  # w, h = (298.0, 420.0)
-        # inputs greeting & ty image
-        greeting_name_img = draw_greetings(customer_name=order['Buyer Name'].values[0])
-        new_page.insertImage((0, 20, 298, 70), stream=greeting_name_img, overlay=True)
-        new_page.insertImage((0, 70, 298, 260), stream=ty_image_bytes)
-        # insert order number & barcode
-        order_number = order['Order ID'].values[0]
-        barcode = generate_barcode(text=order_number, type='qrcode')
-        new_page.insertImage((5, 3, 80, 20), stream=draw_text(order_number, (120, 30), 12))
-        new_page.insertImage((255, 0, 293, 33), stream=barcode)
-        # draws order details
-        order_details_img = draw_order_details(order)[0]
-        new_page.insertImage((0, 270, 298, 420), stream=order_details_img)
-        # finally, inputs buyer note
-        if all(order['Buyer Note'].notnull()):
-            buyers_note = f"Buyer's Note: {order['Buyer Note'].values[0]}"
-            new_page.insertImage((5, 401, 140, 418), stream=draw_text(buyers_note, (300, 30), 12))
-
-    # Picking list
+        add_order_page(chunk_doc, order, render_mode, image_xrefs)
+    if save_profile is None:
+        chunk_bytes = chunk_doc.write()
+    else:
+        if render_mode == 'vector':
+            with stage('subset_fonts'):
+                chunk_doc.subset_fonts()
+        with stage('save'):
+            chunk_bytes = chunk_doc.write(**SAVE_PROFILES[save_profile])
+    chunk_doc.close()
+    if multiprocessing.parent_process() is None:      # already counted in this process
+        return chunk_bytes, {}, {}
+    counts = {name: count - start_counts[name] for name, count in assets.counts().items()}
+    return chunk_bytes, timer.take(), counts
+
+
+def render_chunks(orders, render_mode=RENDER_MODE, workers=WORKERS, save_profile=None):
+    """Yields the pdf bytes of every CHUNK_SIZE orders in order, as soon as each chunk is rendered"""
+    chunks = [orders[i:i+CHUNK_SIZE] for i in range(0, len(orders), CHUNK_SIZE)]
+    if workers <= 1 or len(chunks) <= 1:
+        for chunk in chunks:
+            chunk_bytes, stages, counts = render_orders(chunk, render_mode, save_profile)
+            timer.merge(stages)
+            assets.merge_counts(counts)
+            yield chunk_bytes
+        return
+
+    print(f"Rendering {len(chunks)} chunks across {workers} workers")
+    # At most one chunk per worker is in flight, the next one is submitted as each is yielded in SKU order,
+    # so finished chunks never pile up while the caller is still printing an earlier one
+    executor, chunks = get_executor(workers), iter(chunks)
+    in_flight = deque(executor.submit(render_orders, chunk, render_mode, save_profile)
+                      for chunk in itertools.islice(chunks, workers))
+    while in_flight:
+        chunk_bytes, stages, counts = in_flight.popleft().result()
+        chunk = next(chunks, None)
+        if chunk is not None:
+            in_flight.append(executor.submit(render_orders, chunk, render_mode, save_profile))
+        timer.merge(stages)
+        assets.merge_counts(counts)
+        yield chunk_bytes
+
+
+def add_order_pages(new_doc, orders, render_mode=RENDER_MODE, workers=WORKERS):
+    """Adds packing slips of orders, splitting them into chunks rendered across worker processes"""
+    chunks = [orders[i:i+CHUNK_SIZE] for i in range(0, len(orders), CHUNK_SIZE)]
+    if workers <= 1 or len(chunks) <= 1:
+        image_xrefs = {}
+        for order_no, order in orders:
+            print(f"Processing Order No.: {order_no}")
+            add_order_page(new_doc, order, render_mode, image_xrefs)
+        return
+
+    for chunk_bytes in render_chunks(orders, render_mode, workers):
+        with stage('merge chunk'), fitz.open('pdf', chunk_bytes) as chunk_doc:
+            new_doc.insert_pdf(chunk_doc)
+
+
+def warm_up(*args):
+    """Loads the fonts & images conversions use, run once by the daemon & its worker processes"""
+    import qrcode
+    import pandas
+    from PIL import Image, ImageDraw
+    assets.image_bytes(ty_image_location)
+    for filename in vector_fonts.values():
+        assets.pdf_font(os.path.join(onedrive_folder, filename))
+    for filename, size in [('LiberationSans-Regular.ttf', 16), ('LiberationSans-Bold.ttf', 20),
+                           ('MarckScript-Regular.ttf', 72)]:
+        assets.font(os.path.join(onedrive_folder, filename), size)
+
+
+def get_executor(workers=WORKERS):
+    """Starts the worker processes on first use, later conversions reuse them with their assets warm"""
+    global executor
+    if executor is None or executor._max_workers != workers:
+        shutdown_workers()
+        executor = ProcessPoolExecutor(max_workers=workers)
+    return executor
+
+
+@atexit.register
+def shutdown_workers():
+    global executor
+    if executor is not None:
+        executor.shutdown()
+        executor = None
+
+
+def add_picking_list(new_doc, df, render_mode=RENDER_MODE):
+    """Adds the picking list, the paid quantity of every SKU, returns its page count"""
+    import pandas as pd
     print("Adding Picking List")
     table = pd.pivot_table(df, values=['Product Name', 'Product Variation', 'Qty', 'SKU'], index='Inventory SKU',
-                                aggfunc={'Product Name':'first', 'Product Variation':'first', 'SKU':'first', 'Qty': np.sum})
+                                aggfunc={'Product Name':'first', 'Product Variation':'first', 'SKU':'first', 'Qty': 'sum'})
     table.sort_values(by='SKU', inplace=True)
     print_date = dt.datetime.today().strftime('Print Date: %A, %b %d %Y')
-    print_date_img = draw_text(print_date, (200, 30), 12)
-
-    total_processed_products, page_no = 0, 0
-    while total_processed_products != len(table):
-        new_page = new_doc.newPage(pno = page_no, width = a6_format.width, height = a6_format.height)
-        product_details = draw_order_details(table[total_processed_products: ], size=(596, 840))
-        new_page.insertImage((0, 0, 298, 420), stream=product_details[0])
-        total_processed_products += product_details[1]
-        new_page.insertImage((200, 400, 290, 415), stream=print_date_img)
-        page_no += 1
-
-    print("Saving")
-    save_location = os.path.join(onedrive_folder, 'Ginee Packing List.pdf')
-    new_doc.save(save_location)
-    new_doc.close()
-
-    print("Opening PDF")
-    webbrowser.open(save_location)
+
+    # Page breaks are known before drawing, so the picking list is written first & in order
+    a6_format = fitz.paper_rect('a6')
+    with stage('layout_order_details'):
+        picking_list_pages = layout_order_details(table)
+    for rows in picking_list_pages:
+        new_page = new_doc.new_page(width = a6_format.width, height = a6_format.height)
+        if render_mode == 'vector':
+            insert_vector_fonts(new_page)
+            write_order_details(new_page, (0, 0, 298, 420), rows, size=(596, 840))
+            write_text(new_page, (200, 400, 290, 415), print_date, (200, 30), 12)
+        else:
+            insert_image(new_page, (0, 0, 298, 420), stream=draw_order_details(rows, size=(596, 840)))
+            insert_image(new_page, (200, 400, 290, 415), stream=draw_text(print_date, (200, 30), 12))
+    return len(picking_list_pages)
+
+
+def stream_packing_list(df, orders, render_mode, workers, save_profile, hook):
+    """Writes the picking list & every CHUNK_SIZE packing slips as separate pdfs into a new batch folder,
+    handing each to hook as soon as it is saved, so only one chunk is held in memory at a time"""
+    # A chunk still open in a viewer or held by OneDrive can't be deleted, so each batch gets its own folder
+    batch_folder = os.path.join(stream_folder, f"{dt.datetime.now():%Y-%m-%d %H%M%S}")
+    os.makedirs(batch_folder, exist_ok=True)
+    batch_folders = sorted(glob.glob(os.path.join(stream_folder, '????-??-?? ??????')), reverse=True)
+    for old_batch_folder in batch_folders[STREAM_BATCHES:]:
+        shutil.rmtree(old_batch_folder, ignore_errors=True)
+
+    picking_doc = fitz.open()
+    add_picking_list(picking_doc, df, render_mode)
+    if render_mode == 'vector':
+        with stage('subset_fonts'):
+            picking_doc.subset_fonts()
+    save_location = os.path.join(batch_folder, '000 Picking List.pdf')
+    save_stats = save_pdf(picking_doc, save_location, save_profile)
+    pages = picking_doc.page_count
+    picking_doc.close()
+    if hook:
+        hook(save_location)
+    save_locations = [save_location]
+
+    for chunk_no, chunk_bytes in enumerate(render_chunks(orders, render_mode, workers, save_profile), 1):
+        save_location = os.path.join(batch_folder, f"{chunk_no:03d} Packing Slips.pdf")
+        with open(save_location, 'wb') as f:
+            f.write(chunk_bytes)
+        print(f"Saved {os.path.basename(save_location)}, {round(len(chunk_bytes)/1024, 1)} KB")
+        if hook:
+            hook(save_location)
+        save_locations.append(save_location)
+    save_stats['output_kb'] = round(sum(os.path.getsize(location) for location in save_locations)/1024, 1)
+    return save_locations, pages + len(orders), save_stats
+
+
+def convert_packing_list(render_mode=RENDER_MODE, workers=WORKERS, open_pdf=True, latest_file=None,
+                         save_profile=SAVE_PROFILE, stream=False, hook=None):
+    """Converts exported template excel from Ginee to customized Packing & Picking List in PDF
+
+    render_mode 'vector' writes text as embedded fonts, 'raster' keeps the PIL drawn images
+    workers sets the number of processes rendering the packing slips, returns the saved pdf's location
+    latest_file converts that export instead of the newest one in Downloads
+    save_profile is one of Ginee_Output.SAVE_PROFILES
+    stream saves the picking list & every CHUNK_SIZE packing slips as they finish, returns their locations
+    hook is one of Ginee_Output.OUTPUT_HOOKS or a function called with every saved pdf, 'open' if open_pdf"""
+    print("Starting Ginee Packing List Converter")
+    if hook is None and open_pdf:
+        hook = 'open'
+    hook = OUTPUT_HOOKS.get(hook, hook)
+
+    # Finding latest downloaded excel or csv export
+    if latest_file is None:
+        list_of_exports = glob.glob(os.path.join(downloads_folder, '*.xlsx')) + \
+                          glob.glob(os.path.join(downloads_folder, '*.csv'))
+        latest_file = max(list_of_exports, key=os.path.getctime)
+    with stage('read_export'):
+        df = read_export(latest_file)
+    orders = group_orders(df)
+
+    if stream:
+        save_location, pages, save_stats = stream_packing_list(df, orders, render_mode, workers, save_profile, hook)
+    else:
+        new_doc = fitz.open()
+        add_picking_list(new_doc, df, render_mode)
+        add_order_pages(new_doc, orders, render_mode, workers)      # packing slips
+
+        if render_mode == 'vector':
+            with stage('subset_fonts'):
+                new_doc.subset_fonts()      # keeps only the glyphs used
+
+        print("Saving")
+        save_location = os.path.join(onedrive_folder, 'Ginee Packing List.pdf')
+        save_stats = save_pdf(new_doc, save_location, save_profile)
+        pages = new_doc.page_count
+        new_doc.close()
+    print(f"Saved {pages} pages, {save_stats['output_kb']} KB in {save_stats['save_ms']} ms")
+    print(f"Asset cache: {assets.stats()}")
+    assets.prune_disk_cache(RENDER_CACHE_SIZE)
+    timer.report('convert_packing_list', file=os.path.basename(latest_file), orders=len(orders), pages=pages,
+                 render_mode=render_mode, workers=workers, stream=stream, assets=assets.stats(), **save_stats)
+
+    if hook and not stream:
+        print("Opening PDF" if hook is OUTPUT_HOOKS['open'] else "Printing PDF")
+        hook(save_location)
+    return save_location
 
 
 if __name__ == '__main__':
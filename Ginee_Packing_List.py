@@ -1,142 +1,211 @@
 import os
 import re
 import io
+import csv
+import math
 import time
 import json
 import fitz
+import queue
 import base64
-import qrcode
-import barcode
-from barcode.writer import ImageWriter
+import hashlib
 import datetime as dt
-from PIL import Image
-import logging
-from logging.handlers import RotatingFileHandler
 import webbrowser
-from win10toast_click import ToastNotifier 
-
-
-# Folder locations
-downloads_folder = os.path.join(os.environ.get('HOMEPATH'), 'Downloads')
-onedrive_folder = os.path.join(os.getenv('HOMEPATH'), 'OneDrive', 'Shared Files - Shop', 'Python Scripts', 'Ginee')
-
-# Multiple package icon to bytes
-with Image.open(os.path.join(onedrive_folder, 'package_icon.png'), 'r') as package_icon:
-    imgByteArr = io.BytesIO()
-    package_icon.save(imgByteArr, format='PNG')
-    package_icon_bytes = imgByteArr.getvalue()
-
-barcode.base.Barcode.default_writer_options['write_text'] = False
-
-# Logging Configuration
-logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG)
-stream_handler = logging.StreamHandler()
-rotating_file_handler = RotatingFileHandler(filename=os.path.join(onedrive_folder, 'LOG.log'), mode='a', maxBytes=5000000)
-log_formatter = logging.Formatter('%(asctime)s:%(levelname)s:%(name)s:%(message)s', datefmt='%d-%b-%y %H:%M:%S')
-rotating_file_handler.setFormatter(log_formatter)
-logger.addHandler(stream_handler)
-logger.addHandler(rotating_file_handler)
-
-
-def add_barcode(doc):
-    """Adds barcode in Ginee Packing List pdf file"""
+from threading import Thread
+from Ginee_Assets import assets
+from Ginee_Timing import timer, stage, timed
+from Ginee_Output import save_pdf, print_pixels
+from Ginee_Logging import setup_logging, log_conversion
+try:
+    from win10toast_click import ToastNotifier
+except ImportError:     # windows only, conversions still run without the toast
+    ToastNotifier = None
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:     # falls back to polling the Downloads folder
+    Observer, FileSystemEventHandler = None, object
+
+
+# Folder locations, GINEE_DOWNLOADS & GINEE_FOLDER override them e.g. for Ginee_Benchmark on Linux
+downloads_folder = os.getenv('GINEE_DOWNLOADS') or os.path.join(os.environ.get('HOMEPATH'), 'Downloads')
+onedrive_folder = os.getenv('GINEE_FOLDER') or \
+                  os.path.join(os.getenv('HOMEPATH'), 'OneDrive', 'Shared Files - Shop', 'Python Scripts', 'Ginee')
+registry_location = os.path.join(onedrive_folder, 'Processed Picking Lists.json')
+
+# Multiple package icon, loaded by assets on first use
+package_icon_location = os.path.join(onedrive_folder, 'package_icon.png')
+PACKAGE_ICON_PIXELS = print_pixels(10)      # the 512px icon is drawn 10 pt wide, downsampled to the printer's dpi
+
+# Logging Configuration, written by a background thread with repeated messages collapsed into counts
+logger = setup_logging(__name__, os.path.join(onedrive_folder, 'LOG.log'))
+
+
+@assets.cached('qrcode')
+@timed('generate_qrcode')
+def generate_qrcode(order_number, pixels=None):
+    """Generates transparent qrcode of order number in bytes, pixels sizes it to the printer's resolution"""
+    import qrcode
+    qr = qrcode.QRCode()
+    qr.add_data(order_number)
+    if pixels:      # stays transparent as it is drawn over the picking list
+        qr.make(fit=True)
+        qr.box_size = math.ceil(pixels/(qr.modules_count + 2*qr.border))
+    img = qr.make_image(back_color='TransParent')
+    # img = qrcode.make(order_number)   # w/ white background
+    buffered = io.BytesIO()
+    img.save(buffered, format='PNG', transperancy=0, fill=(255, 0, 0))
+    return buffered.getvalue()
+
+
+def extract_order_numbers(page_dict):
+    """Yields (order number, bbox) of every order number span in a page's text dict"""
+    is_order_number = False
+    for block in page_dict['blocks']:
+        # Order number is located every after image ~> [platform's image] Order Number
+        if block['type'] == 1:
+            is_order_number = True
+            continue
+        elif is_order_number:
+            span = block['lines'][0]['spans'][0]
+            yield re.findall(r'(\w*\d*)', span['text'])[0], span['bbox']
+        is_order_number = False
+
+
+@timed('extract_pages')
+def extract_pages(doc, debug=False):
+    """Extracts (order number, bbox) of every page in a single pass, no json round trip"""
+    page_orders = [list(extract_order_numbers(page.get_text('dict'))) for page in doc]
+    if debug:       # dumps pages in the same format as the saved Picking List.json
+        with open('Output.json', 'w') as f:
+            for page in doc:
+                f.write(page.get_text('json'))
+    return page_orders
+
+
+def index_order_numbers(page_orders):
+    """Maps every order number to its occurrences (page & bbox)"""
+    order_index = {}
+    for page_number, orders in enumerate(page_orders):
+        for order_number, bbox in orders:
+            order_index.setdefault(order_number, []).append({'page': page_number, 'bbox': list(bbox)})
+    return order_index
+
+
+def load_pdf_json(file_location):
+    """Yields page dicts from a file of concatenated page.get_text('json') outputs"""
+    with open(file_location) as f:
+        pdf_json = f.read()
+    decoder, position = json.JSONDecoder(), 0
+    while pdf_json[position:].strip():
+        position = len(pdf_json) - len(pdf_json[position:].lstrip())
+        page_dict, position = decoder.raw_decode(pdf_json, position)
+        yield page_dict
+
+
+def fit_matrix(source_rect, target_rect):
+    """Matrix of show_pdf_page's centered, proportional fit of source_rect into target_rect"""
+    scale = min(target_rect.width/source_rect.width, target_rect.height/source_rect.height)
+    dx = target_rect.x0 + (target_rect.width - source_rect.width*scale)/2 - source_rect.x0*scale
+    dy = target_rect.y0 + (target_rect.height - source_rect.height*scale)/2 - source_rect.y0*scale
+    return fitz.Matrix(scale, 0, 0, scale, dx, dy)
+
+
+def export_order_index(order_index, file_location):
+    """Saves per-order package counts & occurrences as .json or .csv"""
+    if file_location.endswith('.json'):
+        with open(file_location, 'w') as f:
+            json.dump({order_number: {'packages': len(occurrences), 'occurrences': occurrences}
+                       for order_number, occurrences in order_index.items()}, f, indent=1)
+    else:
+        with open(file_location, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['Order Number', 'Packages', 'Pages'])
+            for order_number, occurrences in order_index.items():
+                pages = ' '.join(str(occurrence['page'] + 1) for occurrence in occurrences)
+                writer.writerow([order_number, len(occurrences), pages])
+
+
+def add_barcode(doc, debug=False):
+    """Adds barcode in Ginee Packing List pdf file, debug dumps the extracted pages to Output.json"""
     
     # doc = fitz.open(file_location)
 
+    start = time.perf_counter()
     new_doc = fitz.open()
+    image_xrefs = {}        # images embedded once in new_doc & referenced by later pages
 
-    logger.info(f"Total Orders: {doc.page_count}")
+    logger.info("Total Orders: %s", doc.page_count)
 
-    # tabulates data
-    pdf_json = ""
-    for page in doc:
-        pdf_json += page.get_text('json')
+    # tabulates order numbers & their packages
+    page_orders = extract_pages(doc, debug)
+    order_index = index_order_numbers(page_orders)
+    export_order_index(order_index, os.path.join(onedrive_folder, 'Ginee Picking List Packages.csv'))
 
     # Editing PDF
-    for page in doc:
-        if not page._isWrapped:
-            page.wrap_contents()
+    for source_page, orders in zip(doc, page_orders):
+        if not source_page.is_wrapped:
+            source_page.wrap_contents()
 
         # Scales to a6 portrait
         fmt = fitz.paper_rect('a6')
-        page = new_doc.newPage(width = fmt.width, height = fmt.height)
+        page = new_doc.new_page(width = fmt.width, height = fmt.height)
         print(f"Page number: {page.number}")
-        page.showPDFpage(page.rect, doc, page.number)
-
-        page_json = json.loads(page.get_text('json'))
-
-        with open('Output.json', 'w') as f:
-            f.write(page.get_text('json'))
-
-        # PDF's Rect / Pixel location
-        width, height = page_json['width'], page_json['height']
-
-        for block in page_json['blocks']:
-            try:
-                # Order number is located every after image ~> [platform's image] Order Number
-                if 'image' in block:
-                    is_order_number = True
-                    continue
-
-                # Adds barcode according to order number's rect (w, h, w, h)
-                elif is_order_number:
-                    print(block)
-                    text = block['lines'][0]['spans'][0]['text']
-                    w0, h0, w1, h1 = block['lines'][0]['spans'][0]['bbox']
-                    order_number = re.findall('(\w*\d*)', text)[0]
-                    logger.info(f"Inputting barcode of Order # {order_number}")
-                    
-                    ## Adds barcode
-                    # buffered = io.BytesIO()
-                    # barcode.generate('Code39', order_number, writer=ImageWriter(), output=buffered)
-                    # rect = fitz.Rect(w0+50, h0-3, w0+150, h1+3)
-                    # page.insertImage(rect, stream=buffered.getvalue())
-
-                    # Adds qrcode
-                    qr = qrcode.QRCode()
-                    qr.add_data(order_number)
-                    img = qr.make_image(back_color='TransParent')
-                    # img = qrcode.make(order_number)   # w/ white background
-                    buffered = io.BytesIO()
-                    img.save(buffered, format='PNG', transperancy=0, fill=(255, 0, 0))
-                    rect = fitz.Rect(w0+60, h0-4, w0+90, h1+2)
-                    page.insertImage(rect, stream=buffered.getvalue())
-
-                    # Adds multiple package icon & skus
-                    if len(re.findall(order_number, pdf_json)) > 1:
-                        # icon
-                        logger.debug(f"\tMultiple orders in one package found")
-                        rect = fitz.Rect(w0+90, h0, w0+100, h1)
-                        page.insertImage(rect, stream=package_icon_bytes)
-                        # # sku
-                        # sku = "sample-sku123456-uni(4)"
-
-                        # rect_x1 = 260
-                        # rect_y1 = h0-3
-                        # rect_x2 = 297
-                        # rect_y2 = h1 + 2
-
-                        # rect_width = rect_x2 - rect_x1
-                        # rect_height = rect_y2 - rect_y1
-
-                        # rect = (rect_x1, rect_y1, rect_x2, rect_y2)
-
-                        # fontsize_to_use = rect_width/len(sku)*2 + 0.2
-
-                        # page.insertTextbox(rect, sku,
-                        # fontsize=fontsize_to_use,
-                        # fontname="Times-Roman",
-                        # align=1)
-
-
-                is_order_number = False
-
-            except NameError:
-                continue
-
-    new_doc.save(os.path.join(onedrive_folder, 'Ginee Picking List.pdf'))
-    return 
+        with stage('show_pdf_page'):
+            page.show_pdf_page(page.rect, doc, page.number)
+        matrix = fit_matrix(source_page.rect, page.rect)
+
+        # Adds barcode according to order number's rect (w, h, w, h)
+        for order_number, bbox in orders:
+            w0, h0, w1, h1 = fitz.Rect(bbox) * matrix
+            logger.info("Inputting barcode of Order # %s", order_number)
+
+            ## Adds barcode
+            # buffered = io.BytesIO()
+            # barcode.generate('Code39', order_number, writer=ImageWriter(), output=buffered)
+            # rect = fitz.Rect(w0+50, h0-3, w0+150, h1+3)
+            # page.insertImage(rect, stream=buffered.getvalue())
+
+            # Adds qrcode
+            rect = fitz.Rect(w0+60, h0-4, w0+90, h1+2)
+            qrcode_bytes = generate_qrcode(order_number, print_pixels(rect.width))
+            with stage('insertImage'):     # orders with several packages reuse their qrcode
+                assets.insert_image(page, rect, ('qrcode', order_number), image_xrefs, stream=qrcode_bytes)
+
+            # Adds multiple package icon & skus
+            if len(order_index[order_number]) > 1:
+                # icon
+                logger.debug("\tMultiple orders in one package found")
+                rect = fitz.Rect(w0+90, h0, w0+100, h1)
+                with stage('insertImage'):
+                    assets.insert_image(page, rect, package_icon_location, image_xrefs, pixels=PACKAGE_ICON_PIXELS)
+                # # sku
+                # sku = "sample-sku123456-uni(4)"
+
+                # rect_x1 = 260
+                # rect_y1 = h0-3
+                # rect_x2 = 297
+                # rect_y2 = h1 + 2
+
+                # rect_width = rect_x2 - rect_x1
+                # rect_height = rect_y2 - rect_y1
+
+                # rect = (rect_x1, rect_y1, rect_x2, rect_y2)
+
+                # fontsize_to_use = rect_width/len(sku)*2 + 0.2
+
+                # page.insertTextbox(rect, sku,
+                # fontsize=fontsize_to_use,
+                # fontname="Times-Roman",
+                # align=1)
+
+    save_location = os.path.join(onedrive_folder, 'Ginee Picking List.pdf')
+    save_stats = save_pdf(new_doc, save_location)
+    logger.debug("Asset cache: %s", assets.stats())
+    log_conversion(logger, file=os.path.basename(doc.name), orders=len(order_index), pages=new_doc.page_count,
+                   duration_ms=round((time.perf_counter() - start)*1000, 1), **save_stats)
+    timer.report('add_barcode', orders=len(order_index), pages=new_doc.page_count, assets=assets.stats(), **save_stats)
+    return save_location
 
 
 def open_url(page_url):
@@ -147,54 +216,135 @@ def open_url(page_url):
         print('Failed to open URL. Unsupported variable type.')
 
 
+def is_picking_list(doc):
+    """Checks the first page's header, extracting its text only once"""
+    first_page_text = doc.load_page(0).get_text()
+    matches = ['Picking List', 'Print Date', 'Operator', 'Total Product']
+    return all(match in first_page_text for match in matches)
+
+
+def hash_file(file_location):
+    with open(file_location, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def load_registry():
+    """Content hashes of pdfs already checked or converted"""
+    try:
+        with open(registry_location) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_registry(registry):
+    with open(registry_location, 'w') as f:
+        json.dump(registry, f, indent=1)
+
+
+def process_file(file_location, registry, toaster):
+    """Converts file once if it is a Ginee Picking List not yet in the registry"""
+    if not file_location.endswith('.pdf') or not os.path.isfile(file_location):
+        return
+    if os.path.getsize(file_location) == 0:     # still being written, its modified event follows
+        return
+    file_hash = hash_file(file_location)
+    if file_hash in registry:
+        return
+
+    with fitz.open(file_location) as doc:
+        picking_list = is_picking_list(doc)
+        if picking_list:
+            logger.info("Ginee Picking List Found!")
+            add_barcode(doc)
+            logger.info('Ginee Picking List Conversion Successful & Ready to Print')
+            # showcase
+            picking_list_location = os.path.join(onedrive_folder, 'Ginee Picking List.pdf')
+            if toaster is None:
+                open_url(picking_list_location)
+            else:
+                toaster.show_toast(
+                    "Ginee Picking List", # title
+                    "Click to print! >>", # message 
+                    icon_path=os.path.join(onedrive_folder, 'ginee-app-logo.ico'), # 'icon_path' 
+                    duration=15, # for how many seconds toast should be visible; None = leave notification in Notification Center
+                    threaded=False, # True = run other code in parallel; False = code execution will wait till notification disappears 
+                    callback_on_click=open_url(picking_list_location) # click notification to run function 
+                    )
+        else:
+            logger.debug("%s is not a Ginee Picking List", os.path.basename(file_location))
+
+    # Registers every checked pdf so it is never reopened
+    registry[file_hash] = {'filename': os.path.basename(file_location), 'picking_list': picking_list,
+                           'processed': dt.datetime.now().isoformat(timespec='seconds')}
+    save_registry(registry)
+
+
+class DownloadsHandler(FileSystemEventHandler):
+    """Queues pdfs created, renamed (finished downloads) or modified in the Downloads folder"""
+
+    def __init__(self, file_queue):
+        self.file_queue = file_queue
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self.file_queue.put(event.src_path)
+
+    def on_modified(self, event):
+        self.on_created(event)
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self.file_queue.put(event.dest_path)
+
+
+def poll_downloads(file_queue, interval=3):
+    """Fallback watcher queuing only new or changed files, compared by size & mtime"""
+    snapshot = {}
+    while True:
+        with os.scandir(downloads_folder) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.name.endswith('.pdf'):
+                    stat = entry.stat()
+                    if snapshot.get(entry.path) != (stat.st_size, stat.st_mtime):
+                        snapshot[entry.path] = (stat.st_size, stat.st_mtime)
+                        file_queue.put(entry.path)
+        time.sleep(interval)
+
+
 def main():
     """Script for converting downloaded Ginee Packing Lists"""
     logger.info("Starting Ginee Packing List Converter")
 
-    file_location = os.path.join(onedrive_folder, 'Picking List.pdf')
     os.chdir(downloads_folder)
 
     # initialize 
-    toaster = ToastNotifier()
+    toaster = ToastNotifier() if ToastNotifier is not None else None
+    registry = load_registry()
+    file_queue = queue.Queue()
+
+    # Files downloaded while the watcher was off
+    for filename in os.listdir(downloads_folder):
+        file_queue.put(os.path.join(downloads_folder, filename))
+
+    if Observer is not None:
+        logger.info("Watching Downloads for file events")
+        observer = Observer()
+        observer.schedule(DownloadsHandler(file_queue), downloads_folder, recursive=False)
+        observer.start()
+    else:
+        logger.info("Polling Downloads (install watchdog for file events)")
+        Thread(target=poll_downloads, args=[file_queue], daemon=True).start()
 
     while True:
+        file_location = file_queue.get()        # blocks while idle
         try:
-            for filename in os.listdir(downloads_folder):
-
-                if filename.endswith('.pdf'):
-
-                    with fitz.open(filename) as doc:
-                        first_page = doc.load_page(0)
-                        matches = ['Picking List', 'Print Date', 'Operator', 'Total Product']
-
-                        created_within_10secs = dt.datetime.now().timestamp() - os.path.getctime(filename) <= 100000000
-                        print(f"{filename}: {all(match in first_page.get_text('json') for match in matches)} and {created_within_10secs}")
-                        print(all(match in first_page.get_text('json') for match in matches) and created_within_10secs)
-                        # Skips to next file if no matches found & created more than minute
-                        if all(match in first_page.get_text('json') for match in matches) and created_within_10secs:
-                            logger.info("Ginee Picking List Found!")
-                            add_barcode(doc)
-                            logger.info('Ginee Picking List Conversion Successful & Ready to Print')
-                            # showcase
-                            print(file_location)
-                            toaster.show_toast(
-                                "Ginee Picking List", # title
-                                "Click to print! >>", # message 
-                                icon_path=os.path.join(onedrive_folder, 'ginee-app-logo.ico'), # 'icon_path' 
-                                duration=15, # for how many seconds toast should be visible; None = leave notification in Notification Center
-                                threaded=False, # True = run other code in parallel; False = code execution will wait till notification disappears 
-                                callback_on_click=open_url(file_location) # click notification to run function 
-                                )
-                    # os.replace(filename, os.path.join('Ginee Picking Lists', filename))
-
-            logger.warning("No Ginee Picking List Found")
-
-        # Logs error
+            process_file(file_location, registry, toaster)
+
+        # Logs error, e.g. a pdf still being downloaded; its next event retries it
         except Exception as e:
             logger.error(e)
 
-        time.sleep(3)
-
 
 def pdf_to_json(file_location, file_name):
     with fitz.open(file_location) as doc:
@@ -1,5 +1,9 @@
 import os
 import time
+import fitz
+import queue
+import bisect
+import json
 import sqlite3
 import datetime as dt
 from contextlib import closing
@@ -10,10 +14,13 @@ from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver import ActionChains
-from selenium.common.exceptions import WebDriverException, StaleElementReferenceException, ElementClickInterceptedException
+from selenium.common.exceptions import WebDriverException, ElementClickInterceptedException, TimeoutException
 from tkinter import *
 from tkinter import ttk
-from threading import Thread, current_thread
+from threading import Thread, Lock, current_thread
+from Ginee_Order_Sync import OrderSync, LEFT_PAID_TABLE, GINEE_URL
+from Ginee_Timing import timer, timed
+from Ginee_Output import save_pdf, spool_pdf
 
 
 # File locations & printer name
@@ -21,6 +28,14 @@ onedrive_location = os.path.join(os.getenv('USERPROFILE'), 'OneDrive', 'Shared F
 database_location = os.path.join(onedrive_location, 'Ginee', 'ginee_orders.db')
 PRINTER = 'ZDesigner GK888t'
 PRINTER = 'Microsoft Print to PDF'
+labels_folder = os.path.join(os.getenv('USERPROFILE'), 'Downloads', 'Ginee AWB Labels')
+spool_folder = os.path.join(labels_folder, 'Spool')     # used when Ginee_Output.SPOOLER is 'file'
+
+ARRANGE_RESULTS_TABLE = """CREATE TABLE IF NOT EXISTS arrange_results (
+                            ginee_order_id TEXT, order_number TEXT, status TEXT, arranged_at TIMESTAMP);"""
+BROWSER_SESSION_TABLE = """CREATE TABLE IF NOT EXISTS browser_session (
+                            platform TEXT PRIMARY KEY, cookies TEXT, local_storage TEXT, saved_at TIMESTAMP);"""
+
 
 def setup_cursor():
     # Connects to db in autocommit mode
@@ -29,7 +44,120 @@ def setup_cursor():
     return cur
 
 
-def setup_driver(driver='Edge', headless=False, maximized=False, zoom_level=1.0, window_position=(0, 0)):
+class OrderLookup():
+    """Order number -> ginee order id lookups over one persistent connection & a warm in-memory map"""
+
+    def __init__(self, database_location=database_location):
+        self.conn = sqlite3.connect(database_location, isolation_level=None, check_same_thread=False)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS orders_order_number ON orders (order_number);")
+        self.conn.execute(LEFT_PAID_TABLE)
+        self.lock = Lock()
+        self.orders, self.sorted_orders = {}, None
+        self.refresh()
+
+    def refresh(self):
+        with self.lock:
+            # orders that left PAID stay reachable through the sqlite fallback in get
+            self.orders = dict(self.conn.execute("""SELECT order_number, ginee_order_id FROM orders
+                                                    WHERE ginee_order_id NOT IN (SELECT ginee_order_id FROM left_paid);"""))
+            self.sorted_orders = None
+
+    def add(self, rows):
+        """Adds (ginee_order_id, order_number, ...) rows inserted by scrape or the order sync"""
+        with self.lock:
+            self.orders.update({row[1]: row[0] for row in rows})
+            self.sorted_orders = None
+
+    def has_prefix(self, prefix):
+        """Checks if any known order number starts with prefix"""
+        with self.lock:     # the sync & driver threads add orders while the ui thread checks prefixes
+            if self.sorted_orders is None:
+                self.sorted_orders = sorted(self.orders)
+            sorted_orders = self.sorted_orders
+        i = bisect.bisect_left(sorted_orders, prefix)
+        return i < len(sorted_orders) and sorted_orders[i].startswith(prefix)
+
+    def get(self, order_number):
+        with self.lock:
+            ginee_order_id = self.orders.get(order_number)
+            if ginee_order_id is None:      # falls back to the indexed, parameterized query
+                row = self.conn.execute("SELECT ginee_order_id FROM orders WHERE order_number = ?;",
+                                        (order_number,)).fetchone()
+                if row:
+                    ginee_order_id = self.orders[order_number] = row[0]
+                    self.sorted_orders = None
+        return ginee_order_id
+
+    def order_numbers(self):
+        with self.lock:
+            return list(self.orders)
+
+    def __contains__(self, order_number):
+        return self.get(order_number) is not None
+
+    def close(self):
+        self.conn.close()
+
+
+LOCAL_STORAGE_SCRIPT = "return Object.assign({}, window.localStorage);"
+RESTORE_LOCAL_STORAGE_SCRIPT = """
+var items = arguments[0];
+Object.keys(items).forEach(function (key) { window.localStorage.setItem(key, items[key]); });
+"""
+
+
+LOGIN_BUTTON = '//button[normalize-space()="Login"]'
+
+
+class SessionStore():
+    """Persists a logged in driver's cookies & local storage in sqlite so new drivers skip the login form"""
+    cookie_keys = ('name', 'value', 'domain', 'path', 'secure', 'httpOnly', 'expiry')
+
+    def __init__(self, database_location=database_location, platform='Ginee'):
+        self.database_location = database_location
+        self.platform = platform
+
+    def save(self, driver):
+        cookies = driver.get_cookies()
+        local_storage = driver.execute_script(LOCAL_STORAGE_SCRIPT)
+        with closing(sqlite3.connect(self.database_location, isolation_level=None)) as conn:
+            conn.execute(BROWSER_SESSION_TABLE)
+            conn.execute("INSERT OR REPLACE INTO browser_session VALUES (?, ?, ?, ?);",
+                         (self.platform, json.dumps(cookies), json.dumps(local_storage), dt.datetime.now()))
+
+    def restore(self, driver):
+        """Loads the saved session into driver, returns False if there is none"""
+        with closing(sqlite3.connect(self.database_location, isolation_level=None)) as conn:
+            conn.execute(BROWSER_SESSION_TABLE)
+            row = conn.execute("SELECT cookies, local_storage FROM browser_session WHERE platform = ?;",
+                               (self.platform,)).fetchone()
+        if row is None:
+            return False
+        cookies, local_storage = json.loads(row[0]), json.loads(row[1])
+        driver.get(GINEE_URL + '/favicon.ico')      # cookies & storage can only be set on the site's origin
+        for cookie in cookies:
+            cookie = {key: value for key, value in cookie.items() if key in self.cookie_keys}
+            if 'expiry' in cookie:
+                cookie['expiry'] = int(cookie['expiry'])
+            try:
+                driver.add_cookie(cookie)
+            except WebDriverException as e:
+                print(f"\tSkipped cookie {cookie['name']}: {e}")
+        driver.execute_script(RESTORE_LOCAL_STORAGE_SCRIPT, local_storage)
+        return True
+
+    def is_valid(self, driver, timeout=10):
+        """Loads the orders page with the restored session, valid if Ginee shows it instead of the login form"""
+        driver.get(GINEE_URL + '/main/order')
+        try:
+            WebDriverWait(driver, timeout, poll_frequency=0.25).until(
+                lambda driver: driver.find_elements_by_id('myIframe') or driver.find_elements_by_xpath(LOGIN_BUTTON))
+        except TimeoutException:
+            return False
+        return not driver.find_elements_by_xpath(LOGIN_BUTTON)
+
+
+def setup_driver(driver='Edge', headless=False, maximized=False, zoom_level=1.0, window_position=(0, 0), download_folder=None):
     if driver == 'Chrome':
         driver_path = os.path.join(onedrive_location, 'chromedriver_win32', 'chromedriver.exe')
         driver = webdriver.Chrome(driver_path)
@@ -40,8 +168,14 @@ def setup_driver(driver='Edge', headless=False, maximized=False, zoom_level=1.0,
         if headless:
             options.add_argument('headless')
             options.add_argument('disable-gpu')
+        if download_folder:     # saves pdfs instead of opening them in the viewer
+            options.add_experimental_option('prefs', {'download.default_directory': download_folder,
+                                                      'download.prompt_for_download': False,
+                                                      'plugins.always_open_pdf_externally': True})
         # options.binary_location = PATH
         driver = Edge(driver_path, options = options)
+        if download_folder and headless:
+            driver.execute_cdp_cmd('Page.setDownloadBehavior', {'behavior': 'allow', 'downloadPath': download_folder})
     if zoom_level != 1.0:
         driver.get('edge://settings/')
         driver.execute_script(f'chrome.settingsPrivate.setDefaultZoom({zoom_level});')
@@ -53,8 +187,15 @@ def setup_driver(driver='Edge', headless=False, maximized=False, zoom_level=1.0,
     return driver
 
 
-def login(driver):
+@timed('browser login')
+def login(driver, session_store=None):
+    """Restores the saved session if it is still valid, otherwise logs in with the form & saves the new session"""
     print("LOGGING IN TO GINEE")
+    session_store = session_store or SessionStore()
+    if session_store.restore(driver) and session_store.is_valid(driver):
+        print("\tRestored saved session.")
+        return
+
     # Goes to website
     # driver.implicitly_wait(5)
     driver.get('https://seller.ginee.com/')
@@ -64,7 +205,9 @@ def login(driver):
         data = cur.fetchone()
         ginee_email, ginee_password = data[0], data[1]
 
-    while driver.find_elements_by_xpath('//button[normalize-space()="Login"]'):     #> BUG! Not logging in the first time
+    for attempt in range(3):    # the first attempt can be lost while the page is still loading
+        if not driver.find_elements_by_xpath(LOGIN_BUTTON):
+            break
         # Setting language to English
         WebDriverWait(driver, 10).until(
             EC.presence_of_element_located((By.CLASS_NAME, 'ant-select-arrow'))).click()
@@ -73,14 +216,78 @@ def login(driver):
         # Logging in
         driver.find_element_by_xpath("//*[@placeholder='Please input your email']").send_keys(ginee_email)
         driver.find_element_by_xpath("//*[@placeholder='Please enter password']").send_keys(ginee_password)
-        driver.find_element_by_xpath('//button[normalize-space()="Login"]').click()
-        time.sleep(3)
+        driver.find_element_by_xpath(LOGIN_BUTTON).click()
+        try:
+            WebDriverWait(driver, 10, poll_frequency=0.25).until(
+                EC.invisibility_of_element_located((By.XPATH, LOGIN_BUTTON)))
+        except TimeoutException:
+            print(f"\tLogin attempt {attempt + 1} failed, retrying")
+    if driver.find_elements_by_xpath(LOGIN_BUTTON):
+        raise RuntimeError("Could not log in to Ginee")
+    session_store.save(driver)
     print("\tSucessfully logged in.")
 
 
-def scrape(driver=None, headless=False):
+# Reads every row of the orders table & the pager state in a single round-trip
+ORDERS_TABLE_SCRIPT = """
+var rows = Array.from(document.querySelectorAll('tbody.ant-table-tbody > tr[data-row-key]'), function (row) {
+    var text = row.innerText;
+    return [row.getAttribute('data-row-key'), text.split('\\n')[0].trim(),
+            text.indexOf('Sookee Store') !== -1 ? 'Sookee' : 'Edge'];
+});
+var nextPage = document.querySelector("li[title='Next Page']");
+var activeTab = document.querySelector("[role='tab'][aria-selected='true']");
+return {loading: document.querySelector('.ant-spin-spinning') !== null, rows: rows,
+        empty: rows.length === 0 && document.querySelector('.ant-table-placeholder, .ant-empty') !== null,
+        tab: activeTab && activeTab.getAttribute('aria-controls'),
+        last_page: nextPage === null || nextPage.getAttribute('aria-disabled') !== 'false'};
+"""
+SELECT_ROWS_SCRIPT = """
+return arguments[0].filter(function (key) {
+    var checkbox = document.querySelector('tr[data-row-key="' + key + '"] input.ant-checkbox-input');
+    if (checkbox && !checkbox.checked) { checkbox.click(); }
+    return checkbox !== null;
+});
+"""
+NEXT_PAGE_SCRIPT = "document.querySelector(\"li[title='Next Page']\").click();"
+PAID_TAB = 'rc-tabs-0-panel-PAID'
+
+
+@timed('read_orders_table')
+def read_orders_table(driver, previous_rows=None, timeout=30, tab=None, allow_empty=False):
+    """Waits until the orders table is loaded & differs from previous_rows, then returns it
+
+    tab also waits for that tab to be selected, allow_empty accepts the table's empty placeholder"""
+    def table_changed(driver):
+        table = driver.execute_script(ORDERS_TABLE_SCRIPT)
+        if table['loading'] or tab is not None and table['tab'] != tab:
+            return False
+        if table['rows'] != previous_rows and (table['rows'] or allow_empty and table['empty']):
+            return table
+        return False
+    return WebDriverWait(driver, timeout, poll_frequency=0.25).until(table_changed)
+
+
+def open_paid_tab(driver):
+    """Switches to the order iframe & selects the "Paid" tab, returns its first page"""
+    iframe = WebDriverWait(driver, 10).until(
+                EC.presence_of_element_located((By.ID, 'myIframe')))
+    driver.switch_to.frame(iframe)
+    all_orders = read_orders_table(driver, allow_empty=True)
+    paid_tab = driver.find_element_by_xpath(f"//div[@aria-controls='{PAID_TAB}']")
+    paid_tab.click()
+    try:
+        table = read_orders_table(driver, all_orders['rows'], timeout=10, tab=PAID_TAB, allow_empty=True)
+    except TimeoutException:    # first page of PAID can be the same as the previous tab's, read it again from PAID
+        table = read_orders_table(driver, timeout=5, tab=PAID_TAB, allow_empty=True)
+    return table
+
+
+def scrape(driver=None, headless=False, lookup=None):
+    """Scrapes the PAID orders with driver, or with a one-off headless driver if none is given"""
     print("SCRAPING GINEE ORDER IDs")
-    if headless and driver is None:
+    one_off_driver = headless and driver is None
+    if one_off_driver:
         driver = setup_driver(headless=True)
         login(driver)
 
@@ -89,53 +296,41 @@ def scrape(driver=None, headless=False):
     driver.get("https://seller.ginee.com/main/order")
 
     # Switches frame & select "Paid" tab
-    iframe = WebDriverWait(driver, 10).until(
-                EC.presence_of_element_located((By.ID, 'myIframe')))
-    driver.switch_to.frame(iframe)
-    paid_tab = driver.find_element_by_xpath("//div[@aria-controls='rc-tabs-0-panel-PAID']")
-    paid_tab.click()
-    time.sleep(3)
+    table = open_paid_tab(driver)
 
     # Inserting pending data to sqlite
-    next_page_exists = True
     with closing(setup_cursor()) as cur:
-        while next_page_exists:     # Waits until table is fully loaded
-            try:
-                print("LOADING TABLE. . .")
-                WebDriverWait(driver, 30).until(EC.presence_of_element_located((
-                                                    By.XPATH, "//td[@class='ant-table-cell ant-table-cell-fix-right ant-table-cell-fix-right-first']")))
-                table_rows = driver.find_elements_by_xpath("//tbody[@class='ant-table-tbody']/tr")
-                print(f"LENGTH OF TABLE: {len(table_rows)}")
-
-                for row in table_rows:
-                    ginee_order_id = row.get_attribute("data-row-key")
-                    order_number = row.text.split('\n')[0]
-                    store = 'Sookee' if 'Sookee Store' in row.text else 'Edge'
-                    print(f"INSERTING {store}  {order_number}  ({ginee_order_id})")
-                    cur.execute("""INSERT OR IGNORE INTO orders 
-                                    VALUES (?, ?, ?, ?);""", (ginee_order_id, order_number, dt.datetime.now(), store))
-                next_page = driver.find_element_by_xpath("//li[@title='Next Page']")
-
-                if next_page.get_attribute("aria-disabled") == 'false':
-                    next_page.click()
-                    print("CLICKING NEXT PAGE")
-                else:
-                    next_page_exists = False
-                    print("END OF PAGE")
-
-            except (StaleElementReferenceException, ElementClickInterceptedException) as e:
-                print(f"TABLE NOT FULLY LOADED: {e}")
-                time.sleep(1)
-                pass
-    if headless and driver is None:
+        while True:
+            print(f"LENGTH OF TABLE: {len(table['rows'])}")
+            for ginee_order_id, order_number, store in table['rows']:
+                print(f"INSERTING {store}  {order_number}  ({ginee_order_id})")
+            rows = [(ginee_order_id, order_number, dt.datetime.now(), store)
+                    for ginee_order_id, order_number, store in table['rows']]
+            cur.executemany("""INSERT OR IGNORE INTO orders 
+                                VALUES (?, ?, ?, ?);""", rows)
+            if lookup is not None:
+                lookup.add(rows)
+            if table['last_page']:
+                print("END OF PAGE")
+                break
+
+            driver.execute_script(NEXT_PAGE_SCRIPT)
+            print("CLICKING NEXT PAGE")
+            print("LOADING TABLE. . .")
+            table = read_orders_table(driver, table['rows'])
+    if one_off_driver:
         print("Quitting headless driver ")
         driver.quit()
 
 
-def go_order(driver, order_number):
-    with closing(setup_cursor()) as cur:
-        cur.execute(f"SELECT ginee_order_id FROM orders WHERE order_number = '{order_number}';")
-        ginee_order_id = cur.fetchone()[0]
+@timed('go_order')
+def go_order(driver, order_number, lookup=None):
+    if lookup is not None:
+        ginee_order_id = lookup.get(order_number)
+    else:
+        with closing(setup_cursor()) as cur:
+            cur.execute("SELECT ginee_order_id FROM orders WHERE order_number = ?;", (order_number,))
+            ginee_order_id = cur.fetchone()[0]
     # Goes to order page
     driver.get(f"https://seller.ginee.com/main/order/order-detail?orderId={ginee_order_id}")
 
@@ -182,6 +377,7 @@ def close_tabs(driver, main_window):
 
 
 def arrange_shipment(driver):
+    """Arranges shipment of the open order, returns False if it failed"""
     print("ARRANGING SHIPMENT")
     switch_to_iframe(driver)
     close_popupwindow(driver)
@@ -193,49 +389,59 @@ def arrange_shipment(driver):
         WebDriverWait(driver, 5).until(
                 EC.presence_of_element_located((By.XPATH, "//button[normalize-space()='Arrange Shipment']"))).click()
         print("\tSuccess.")
+        return True
     except Exception as e:
         print("\tFailed.\n")
         print(e)
+        return False
+
+
+@timed('generate_label')
+def generate_label(driver):
+    """Clicks through Print & Print Label until Ginee opens the AWB pdf in another tab"""
+    # Clicking Print button from the order page
+    print("\tFinding print button")
+    print_button = driver.find_elements_by_xpath("//button[normalize-space()='Print']")
+    if print_button:  # Only available in the order page
+        print_button[0].click()
+        time.sleep(0.25)
+
+    # Generate AWB pdf in other tab
+    print("\tFinding print label button")
+    WebDriverWait(driver, 5).until(EC.presence_of_element_located(
+                            (By.XPATH, "//*[normalize-space()='Print Label']")))
+    print_labels = driver.find_elements_by_xpath("//*[normalize-space()='Print Label']")
+
+    for print_label in print_labels:
+        try:
+            print('Clicking print label')
+            print_label.click()
+        except ElementClickInterceptedException as e:
+            print(e)
+            pass
+
+    time.sleep(2)
+    order_page_url = 'order/order-detail?orderId=' in driver.current_url
+
+    if order_page_url:
+        WebDriverWait(driver, 10).until(EC.presence_of_element_located(
+                                (By.XPATH, "//td/button[normalize-space()='Print']"))).click()
+    else:
+        switch_to_iframe(driver)
+        WebDriverWait(driver, 10).until(EC.presence_of_element_located(
+                                (By.XPATH, "//button[normalize-space()='Print']"))).click()
 
 
+@timed('print_pdf')
 def print_pdf(driver):
+    """Prints the open order's AWB label through the print preview, returns False if it failed"""
     print("PRINTING PDF")
     switch_to_iframe(driver)
     main_window = driver.current_window_handle
     close_tabs(driver, main_window)
     close_popupwindow(driver)
     try:
-        print("\tFinding print button")
-        # Clicking Print button from the order page
-        print_button = driver.find_elements_by_xpath("//button[normalize-space()='Print']")
-        if print_button:  # Only available in the order page
-            print_button[0].click()
-            time.sleep(0.25)
-
-        # Generate AWB pdf in other tab
-        print("\tFinding print label button")
-        WebDriverWait(driver, 5).until(EC.presence_of_element_located(
-                                (By.XPATH, "//*[normalize-space()='Print Label']")))
-        print_labels = driver.find_elements_by_xpath("//*[normalize-space()='Print Label']")
-
-        for print_label in print_labels:
-            try:
-                print('Clicking print label')
-                print_label.click()
-            except ElementClickInterceptedException as e:
-                print(e)
-                pass
-
-        time.sleep(2)
-        order_page_url = 'order/order-detail?orderId=' in driver.current_url
-
-        if order_page_url:
-            WebDriverWait(driver, 10).until(EC.presence_of_element_located(
-                                    (By.XPATH, "//td/button[normalize-space()='Print']"))).click()
-        else:
-            switch_to_iframe(driver)
-            WebDriverWait(driver, 10).until(EC.presence_of_element_located(
-                                    (By.XPATH, "//button[normalize-space()='Print']"))).click()
+        generate_label(driver)
 
         # Switches tab then prints
         print('\tswitching to pdf tab')
@@ -254,22 +460,217 @@ def print_pdf(driver):
         driver.find_element_by_xpath("//button[normalize-space()='Print']").click()
         print("\tPrinted.")
         close_tabs(driver, main_window)
+        return True
     except Exception as e:
         print("\tFailed.\n")
         print(e)
+        return False
+
+
+@timed('download_label')
+def download_label(driver, order_number, lookup=None, timeout=30):
+    """Downloads an order's AWB label pdf into labels_folder, returns its location"""
+    existing_files = set(os.listdir(labels_folder))
+    main_window = driver.current_window_handle
+    go_order(driver, order_number, lookup)
+    switch_to_iframe(driver)
+    close_popupwindow(driver)
+    generate_label(driver)
+
+    # Waits for the finished download, the pdf viewer is disabled in setup_driver
+    def label_downloaded(driver):
+        new_files = [filename for filename in set(os.listdir(labels_folder)) - existing_files
+                     if filename.endswith('.pdf')]
+        return new_files and os.path.join(labels_folder, new_files[0])
+    label_location = WebDriverWait(driver, timeout, poll_frequency=0.25).until(label_downloaded)
+    close_tabs(driver, main_window)
+    return label_location
+
+
+def batch_print(driver, order_numbers, lookup=None):
+    """Downloads the AWB labels of order_numbers, merges them & prints them as one job"""
+    print(f"BATCH PRINTING {len(order_numbers)} LABELS")
+    os.makedirs(labels_folder, exist_ok=True)
+    batch = fitz.open()
+    printed, failed = [], []
+    for order_number in order_numbers:
+        try:
+            with fitz.open(download_label(driver, order_number, lookup)) as label:
+                batch.insert_pdf(label)
+            printed.append(order_number)
+        except Exception as e:
+            print(f"\tFailed {order_number}: {e}")
+            failed.append(order_number)
+
+    if printed:
+        batch_location = os.path.join(labels_folder, f"AWB Batch {dt.datetime.now():%Y-%m-%d %H%M%S}.pdf")
+        save_pdf(batch, batch_location)
+        spool_pdf(batch_location, PRINTER, spool_folder)
+        print(f"\tPrinted {len(printed)} labels.")
+    batch.close()
+    return printed, failed
+
+
+def batch_arrange_shipment(driver, order_numbers=None, lookup=None):
+    """Arranges shipment of many orders with the PAID tab's multi-select, records results in sqlite
+
+    order_numbers defaults to every order still in PAID"""
+    print("BATCH ARRANGING SHIPMENT")
+    driver.get("https://seller.ginee.com/main/order")
+    # Switches frame & select "Paid" tab
+    table = open_paid_tab(driver)
+    if order_numbers is None:
+        order_numbers = [row[1] for row in table['rows']] if lookup is None else lookup.order_numbers()
+    pending, results = set(order_numbers), []
+
+    # Orders arranged by an earlier, interrupted run of this batch are reported, not looked for again
+    with closing(setup_cursor()) as cur:
+        cur.execute(ARRANGE_RESULTS_TABLE)
+        for row in cur.execute("SELECT * FROM arrange_results WHERE status = 'arranged';").fetchall():
+            if row[1] in pending:
+                results.append(row)
+                pending.discard(row[1])
+
+    def record(page_results):
+        """Writes results as soon as they are known, a later page failing keeps the earlier pages'"""
+        with closing(setup_cursor()) as cur:
+            cur.execute(ARRANGE_RESULTS_TABLE)
+            cur.execute(LEFT_PAID_TABLE)
+            cur.executemany("INSERT INTO arrange_results VALUES (?, ?, ?, ?);", page_results)
+            cur.executemany("INSERT OR IGNORE INTO left_paid VALUES (?, ?);",
+                            [(result[0], result[3]) for result in page_results if result[2] == 'arranged'])
+        results.extend(page_results)
+
+    while pending:
+        selected = {ginee_order_id: order_number for ginee_order_id, order_number, store in table['rows']
+                    if order_number in pending}
+        if selected:
+            # Ticks every pending order of this page, then one batch action covers them all
+            driver.execute_script(SELECT_ROWS_SCRIPT, list(selected))
+            WebDriverWait(driver, 5).until(EC.element_to_be_clickable(
+                    (By.XPATH, "//button[normalize-space()='Arrange Shipment']"))).click()
+            WebDriverWait(driver, 10).until(EC.element_to_be_clickable(
+                    (By.XPATH, "//div[contains(@class, 'ant-modal')]//button[normalize-space()='Arrange Shipment']"))).click()
+            try:        # arranged orders leave the table
+                table = read_orders_table(driver, table['rows'], timeout=15)
+            except TimeoutException:
+                table = driver.execute_script(ORDERS_TABLE_SCRIPT)
+            remaining = {row[0] for row in table['rows']}
+            page_results = []
+            for ginee_order_id, order_number in selected.items():
+                status = 'failed' if ginee_order_id in remaining else 'arranged'
+                print(f"\t{order_number}: {status}")
+                page_results.append((ginee_order_id, order_number, status, dt.datetime.now()))
+            record(page_results)
+            pending -= set(selected.values())
+            continue    # orders from the next page shift into this one
+
+        if table['last_page']:
+            break
+        driver.execute_script(NEXT_PAGE_SCRIPT)
+        table = read_orders_table(driver, table['rows'])
+
+    record([(lookup.get(order_number) if lookup is not None else None, order_number, 'not in PAID', dt.datetime.now())
+            for order_number in pending])
+    return results
 
 
 def arrange_shipment_and_print(driver):
-    arrange_shipment(driver)
-    print_pdf(driver)
+    arranged = arrange_shipment(driver)
+    printed = print_pdf(driver)
+    return arranged and printed
+
+
+class DriverQueue():
+    """Owns one driver & runs its jobs one at a time, in the order they were scanned"""
+
+    def __init__(self, open_driver, report):
+        self.open_driver = open_driver      # returns a logged in driver
+        self.report = report                # called with every job's state & timing
+        self.driver = None
+        self.jobs = queue.Queue()
+        self.thread = Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, name, job, *args):
+        """Queues job(driver, *args), returns immediately"""
+        state = {'name': name, 'state': 'queued', 'queued': time.perf_counter(), 'pending': self.jobs.qsize() + 1}
+        self.report(state)
+        self.jobs.put((state, job, args))
+
+    def run(self):
+        try:
+            self.driver = self.open_driver()
+        except Exception as e:      # e.g. the login failed, the next job tries again
+            print(e)
+            self.report({'name': 'OPENING GINEE', 'state': 'failed', 'error': str(e), 'pending': self.jobs.qsize()})
+        while True:
+            state, job, args = self.jobs.get()
+            if job is None:
+                break
+            state.update(state='running', started=time.perf_counter(), pending=self.jobs.qsize())
+            self.report(state)
+            try:
+                if self.driver is None:
+                    self.reopen_driver()
+                try:
+                    state['result'] = job(self.driver, *args)
+                except WebDriverException:
+                    # Retries the job once only if the browser was closed or crashed, a job failing
+                    # on a live browser may have partly run & is not repeated
+                    if self.driver_alive():
+                        raise
+                    state.update(state='reopening')
+                    self.report(state)
+                    self.reopen_driver()
+                    state['result'] = job(self.driver, *args)
+                state['state'] = 'done'
+            except Exception as e:
+                print(e)
+                state.update(state='failed', error=str(e))
+            state.update(finished=time.perf_counter(), pending=self.jobs.qsize())
+            if timer.enabled:
+                timer.record(f"job {getattr(job, '__name__', 'job')}", state['finished'] - state['started'])
+            self.report(state)
+
+    def reopen_driver(self):
+        """Quits the current driver, even a crashed one, & opens a new one"""
+        if self.driver is not None:
+            try:
+                self.driver.quit()
+            except Exception as e:
+                print(f"\tCould not quit driver: {e}")
+            self.driver = None
+        self.driver = self.open_driver()    # restores the saved session instead of logging in
+
+    def driver_alive(self):
+        try:
+            self.driver.window_handles
+            return True
+        except WebDriverException:
+            return False
+
+    def close(self):
+        self.jobs.put(({}, None, ()))
+        self.thread.join()
+        if self.driver is not None:
+            try:
+                self.driver.quit()
+            except Exception as e:
+                print(f"\tCould not quit driver: {e}")
 
 
 class Application():
     time_out = 3000
+    drivers = 1         # more pre-logged-in drivers let the next order load while the current one prints
+    scan_gap = 100      # ms without keystrokes ending a scan that has no Enter
+    sync_interval = 1800000     # ms of idle before the orders are synced again
     barcode_commands = {    
                         'READY TO SHIP': arrange_shipment,
                         'PRINT': print_pdf,
-                        'RTS&P': arrange_shipment_and_print
+                        'RTS&P': arrange_shipment_and_print,
+                        'BATCH ARRANGE': batch_arrange_shipment,    # arranges every order scanned since the last batch
+                        'BATCH PRINT': batch_print      # prints every order scanned since the last batch
     }
 
     def __init__(self, root):
@@ -279,76 +680,193 @@ class Application():
         root.geometry("400x70")
         self.entry = Entry(root, font=('default', 16))
         self.entry.place(x=10, y=5, width=380, height=50)
-        reg = root.register(self.callback)
-        self.entry.config(validate="all", validatecommand=(reg, '%P'))
+        self.entry.bind('<Return>', self.scan_complete)
+        self.entry.bind('<KeyRelease>', self.key_released)
+        self.scan_job, self.last_key_time = None, None
         self.answer = Label(root, text='Please scan barcode', font=(None, 10), bg='white')
         self.answer.pack(pady=30)
         root.after(1000, self.reduce_time_out)
+        self.sync_job = root.after(self.sync_interval, self.idle_sync)
         root.bind_all("<Any-KeyPress>", self.reset_timer)
         root.bind_all("<Any-ButtonPress>", self.reset_timer)
         root.protocol("WM_DELETE_WINDOW", self.close_driver)    # Closes driver on closing of tkinter
         # Initialize Seleniums
-        self.driver = self.open_ginee()
-        Thread(target=scrape, args=[None, True]).start()
+        self.lookup = OrderLookup()
+        self.order_sync = OrderSync()
+        self.driver_queues = [DriverQueue(self.open_ginee, self.report) for _ in range(self.drivers)]
+        self.order_queue = self.driver_queues[0]       # queue of the driver showing the last scanned order
+        self.orders_opened = 0
+        self.pending_orders = []            # orders scanned since the last batch print
+        self.headless_queue = None          # one long-lived headless driver for batch actions & scrapes
+        self.headless_lock = Lock()
+        Thread(target=self.sync_orders).start()
 
     def open_ginee(self, headless=False):
         print("OPENING GINEE")
         driver = setup_driver(headless=headless, maximized=True, window_position=(-1000, 0))
         login(driver)
+        root.after(0, root.focus_force)      # focuses on window
+        root.after(0, self.entry.focus)
         return driver
 
-    def callback(self, input):
+    def sync_orders(self):
+        """Syncs orders over http, scraping with a headless browser only if the http sync fails"""
+        try:
+            self.order_sync.sync(self.lookup)
+            self.set_status('Please scan barcode')
+        except Exception as e:
+            print(f"HTTP SYNC FAILED: {e}")
+            self.order_sync.logged_in = False
+            self.get_headless_queue().submit('SCRAPE', self.scrape_orders)
+
+    def get_headless_queue(self):
+        with self.headless_lock:
+            if self.headless_queue is None:
+                self.headless_queue = DriverQueue(self.open_headless_driver, self.report)
+        return self.headless_queue
+
+    def set_status(self, text, fg='black'):
+        """Updates the status label from any thread"""
+        root.after(0, lambda: self.answer.config(text=text, fg=fg))
+
+    def report(self, job):
+        """Shows a driver job's state & timing in the status label"""
+        if job['state'] == 'queued':
+            text, fg = f"{job['name']}: queued ({job['pending']} waiting)", 'blue'
+        elif job['state'] == 'running':
+            text, fg = f"{job['name']}: running (waited {job['started'] - job['queued']:.1f}s)", 'blue'
+        elif job['state'] == 'reopening':
+            text, fg = 'PLEASE WAIT: Re-opening Ginee', 'black'
+        elif job['state'] == 'done':
+            text, fg = job.get('result') or (f"{job['name']}: done in {job['finished'] - job['started']:.1f}s", 'green')
+        else:
+            text, fg = f"{job['name']}: FAILED" + (f" ({job['error'][:60]})" if job.get('error') else ''), 'red'
+        if job['state'] in ('done', 'failed') and job['pending']:
+            text += f" ({job['pending']} queued)"
+        self.set_status(text, fg)
+
+    def key_released(self, event):
+        """Restarts the scan gap timer on every character the scanner types"""
+        if event.keysym == 'Return':
+            return
+        self.last_key_time = time.perf_counter()
+        if self.scan_job is not None:
+            root.after_cancel(self.scan_job)
+        self.scan_job = root.after(self.scan_gap, self.scan_gap_elapsed)
+
+        # Partial input is only checked against known prefixes, never sqlite
+        input = self.entry.get().strip()
+        if input == "":
+            self.answer.config(text="Please scan barcode", fg='black')
+        elif any(command.startswith(input) for command in self.barcode_commands) or self.lookup.has_prefix(input):
+            self.answer.config(text='. . .', fg='blue')
+        else:
+            self.answer.config(text="ORDER NUMBER NOT FOUND", fg='red')
+
+    def scan_gap_elapsed(self):
+        """Treats a pause in typing as the end of a scan once the input is a command or known order"""
+        self.scan_job = None
+        input = self.entry.get().strip()
+        if input in self.barcode_commands or input in self.lookup.orders:
+            self.scan_complete()
+
+    def scan_complete(self, event=None):
+        """Runs exactly one lookup per scan, ended by the scanner's Enter or a scan gap"""
+        if self.scan_job is not None:
+            root.after_cancel(self.scan_job)
+            self.scan_job = None
+        input = self.entry.get()
+        self.entry.delete(0, 'end')
+        self.callback(input, self.last_key_time or time.perf_counter())
+
+    def callback(self, input, scan_time):
         """Verifies if barcode input is valid"""
         input = input.strip()
         print(input)
 
-        if input in self.barcode_commands:
+        if input in ('BATCH ARRANGE', 'BATCH PRINT'):
             self.answer.config(text='Command Accepted!')
-            order_page_url = self.driver.current_url
-
-            if 'order/order-detail?orderId=' not in order_page_url:
-                self.answer.config(text='Please go to order page!', fg='purple')
-                return True
-
-            # Execute command scripts
-            Thread(target=self.barcode_commands[input], args=[self.driver]).start()
-            print('DONE!')
-            return True
+            if input == 'BATCH ARRANGE':
+                self.get_headless_queue().submit(f'{input} ({len(self.pending_orders)})', self.arrange_orders,
+                                                 list(self.pending_orders))
+            else:
+                self.get_headless_queue().submit(f'{input} ({len(self.pending_orders)})', self.print_labels,
+                                                 self.pending_orders)
+                self.pending_orders = []
+
+        elif input in self.barcode_commands:
+            self.answer.config(text='Command Accepted!')
+            # Execute command scripts on the driver showing the scanned order
+            self.order_queue.submit(input, self.run_command, input)
 
-        # Goes to order page
+        # Goes to order page, spreading orders over the drivers
         elif len(input) >= 12:
-            with closing(setup_cursor()) as cur:
-                cur.execute(f"SELECT ginee_order_id FROM orders WHERE order_number = '{input}'")
-                if cur.fetchone():  # if exists
-                    try:
-                        go_order(self.driver, input)
-                    except WebDriverException:
-                        self.answer.config(text=f'PLEASE WAIT: Re-opening Ginee')
-                        self.driver.quit()
-                        self.driver = self.open_ginee()
-                        root.focus_force()      # focuses on window
-                        self.entry.focus()
-                        go_order(self.driver, input)
-                    return True
-                else:
-                    self.answer.config(text="ORDER NUMBER NOT FOUND", fg='red')
-                    return True
+            self.order_queue = self.driver_queues[self.orders_opened % len(self.driver_queues)]
+            self.orders_opened += 1
+            self.order_queue.submit(input, self.open_order, input, scan_time)
 
         elif input == "":
             self.answer.config(text="Please scan barcode", fg='black')
-            return True
 
         else:
-            self.answer.config(text='. . .', fg='blue')
-            return True
+            self.answer.config(text="ORDER NUMBER NOT FOUND", fg='red')
+
+    def run_command(self, driver, command):
+        order_page_url = driver.current_url
+        if 'order/order-detail?orderId=' not in order_page_url:
+            return 'Please go to order page!', 'purple'
+        if self.barcode_commands[command](driver) is False:
+            return f'{command}: FAILED', 'red'
+        print('DONE!')
+
+    def open_headless_driver(self):
+        driver = setup_driver(headless=True, download_folder=labels_folder)
+        login(driver)
+        return driver
+
+    def scrape_orders(self, driver):
+        scrape(driver, lookup=self.lookup)
+        SessionStore().save(driver)     # keeps the saved cookies as fresh as the scrape's
+        return 'Orders scraped', 'green'
+
+    def arrange_orders(self, driver, order_numbers):
+        results = batch_arrange_shipment(driver, order_numbers, self.lookup)
+        failed = [order_number for _, order_number, status, _ in results if status != 'arranged']
+        if failed:
+            return f"Arranged {len(results) - len(failed)} orders, FAILED: {' '.join(failed)}", 'red'
+        return f"Arranged {len(results)} orders", 'green'
+
+    def print_labels(self, driver, order_numbers):
+        printed, failed = batch_print(driver, order_numbers, self.lookup)
+        if failed:
+            return f"Printed {len(printed)} labels, FAILED: {' '.join(failed)}", 'red'
+        return f"Printed {len(printed)} labels", 'green'
+
+    def open_order(self, driver, order_number, scan_time):
+        if order_number not in self.lookup:     # unknown to the warm map, checked with sqlite off the ui thread
+            return "ORDER NUMBER NOT FOUND", 'red'
+        if order_number not in self.pending_orders:     # only known orders go into the next batch
+            self.pending_orders.append(order_number)
+        latency = (time.perf_counter() - scan_time)*1000      # scan finished -> order page requested
+        go_order(driver, order_number, self.lookup)
+        return f'{order_number} ({latency:.1f} ms)', 'green'
 
     def reset_timer(self, event=None):
-        # Resets timer to 2 seconds
+        # Resets timer to 2 seconds & the idle sync to 30 minutes
         if event is not None:
             self.time_out = 2000
+            root.after_cancel(self.sync_job)
+            self.sync_job = root.after(self.sync_interval, self.idle_sync)
         else:
             pass
 
+    def idle_sync(self):
+        """Syncs orders after every 30 minutes of idle"""
+        print("IDLE FOR 30 MINUTES, SYNCING")
+        self.answer.config(text='PLEASE WAIT (SYNCING)', fg='red')
+        Thread(target=self.sync_orders).start()
+        self.sync_job = root.after(self.sync_interval, self.idle_sync)
+
     def reduce_time_out(self):
         self.time_out = self.time_out-1000
         print(self.time_out)
@@ -358,16 +876,15 @@ class Application():
             print("TIMEOUT REACHES 0")
             self.entry.delete(0, 'end')
             self.reset_timer()
-        # Scrapes every 30 minutes of idle
-        elif self.time_out % -1800000 == 1:
-            print("TIMEOUT REACHES -1800000")
-            self.answer.config(text='PLEASE WAIT (SCRAPING)', fg='red')
-            Thread(target=scrape, args=(None, True)).start()
 
     def close_driver(self):
         print("Application closed")
         print("\tClosing driver...")
-        self.driver.quit()
+        for driver_queue in self.driver_queues + [self.headless_queue]:
+            if driver_queue is not None:
+                driver_queue.close()
+        self.lookup.close()
+        timer.report('barcode_app', orders_opened=self.orders_opened)
         root.destroy()
         print("\tSUCCESS!")
 
@@ -0,0 +1,140 @@
+import os
+import sys
+import math
+import json
+import time
+import functools
+import datetime as dt
+from threading import Lock
+from contextlib import nullcontext
+
+
+class Timer():
+    """Collects durations of named stages, does nothing while disabled
+
+    GINEE_TIMING=<file.jsonl> enables it, GINEE_PROFILE=cprofile|tracemalloc captures one run"""
+
+    def __init__(self):
+        self.enabled = False
+        self.location = None
+        self.stages = {}
+        self.lock = Lock()
+        self.profiler = None
+        self.started = time.perf_counter()
+
+    def enable(self, location='Ginee Timings.jsonl'):
+        self.enabled, self.location = True, location
+
+    def record(self, name, seconds):
+        with self.lock:
+            self.stages.setdefault(name, []).append(seconds)
+
+    def take(self):
+        """Returns & clears the recorded durations, e.g. to send them back from a worker process"""
+        with self.lock:
+            stages, self.stages = self.stages, {}
+        return stages
+
+    def merge(self, stages):
+        with self.lock:
+            for name, durations in stages.items():
+                self.stages.setdefault(name, []).extend(durations)
+
+    def summary(self):
+        """count, total, p50 & p95 in milliseconds per stage"""
+        def percentile(durations, p):
+            return durations[max(math.ceil(p/100*len(durations)) - 1, 0)]*1000
+
+        stages = self.take()
+        summary = {}
+        for name, durations in stages.items():
+            durations.sort()
+            summary[name] = {'count': len(durations), 'total_ms': round(sum(durations)*1000, 3),
+                             'p50_ms': round(percentile(durations, 50), 3),
+                             'p95_ms': round(percentile(durations, 95), 3)}
+        return summary
+
+    def report(self, run, **details):
+        """Writes this run's stage summary as one json line, then starts a new run"""
+        if self.profiler is not None:       # a profile covers the first run only
+            self.stop_profile(f"Ginee Profile {run}")
+        if not self.enabled:
+            return
+        line = {'run': run, 'script': os.path.basename(sys.argv[0]), 'time': dt.datetime.now().isoformat(),
+                'duration_ms': round((time.perf_counter() - self.started)*1000, 3), **details,
+                'stages': self.summary()}
+        with open(self.location, 'a') as f:
+            f.write(json.dumps(line) + '\n')
+        self.started = time.perf_counter()
+        return line
+
+    def start_profile(self, kind):
+        """Captures a cProfile or tracemalloc profile until stop_profile"""
+        if kind == 'cprofile':
+            import cProfile
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        elif kind == 'tracemalloc':
+            import tracemalloc
+            tracemalloc.start(25)
+            self.profiler = tracemalloc
+
+    def stop_profile(self, location):
+        if self.profiler is None:
+            return
+        if self.profiler.__class__.__name__ == 'Profile':
+            self.profiler.disable()
+            self.profiler.dump_stats(location + '.prof')
+        else:
+            snapshot = self.profiler.take_snapshot()
+            self.profiler.stop()
+            with open(location + '.tracemalloc.txt', 'w') as f:
+                for stat in snapshot.statistics('lineno')[:50]:
+                    f.write(f"{stat}\n")
+        self.profiler = None
+
+
+class Stage():
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        timer.record(self.name, time.perf_counter() - self.start)
+
+
+NULL_STAGE = nullcontext()
+
+
+def stage(name):
+    """with stage('save'): ... times the block while timing is enabled"""
+    return Stage(name) if timer.enabled else NULL_STAGE
+
+
+def timed(name):
+    """Decorator timing every call of a function as stage name"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not timer.enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                timer.record(name, time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+
+# Shared by Ginee_PDF_Converter, Ginee_Packing_List & Ginee_Selenium
+timer = Timer()
+if os.getenv('GINEE_TIMING'):
+    timer.enable(os.getenv('GINEE_TIMING') if os.getenv('GINEE_TIMING') != '1' else 'Ginee Timings.jsonl')
+if os.getenv('GINEE_PROFILE'):
+    timer.start_profile(os.getenv('GINEE_PROFILE'))
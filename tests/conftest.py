@@ -0,0 +1,11 @@
+import os
+import sys
+import tempfile
+
+# The modules resolve their folders from these at import, point them at a scratch folder
+scratch_folder = tempfile.mkdtemp(prefix='ginee-tests-')
+for variable in ('USERPROFILE', 'HOMEPATH'):
+    os.environ.setdefault(variable, scratch_folder)
+os.environ.setdefault('GINEE_FOLDER', scratch_folder)
+os.environ.setdefault('GINEE_DOWNLOADS', scratch_folder)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
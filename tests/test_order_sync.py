@@ -0,0 +1,89 @@
+"""Runs OrderSync.sync against the replay server & the responses recorded in tests/recordings
+
+full_sync holds 250 PAID orders, incremental_sync 8 newer orders on top of them, recorded up to
+page 1 where an incremental sync stops, & left_paid_sync the same list after 10 orders were arranged."""
+import os
+import glob
+import json
+import sqlite3
+from contextlib import closing
+import pytest
+from Ginee_Order_Sync import OrderSync, serve_recordings, order_store, order_time
+
+
+recordings_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'recordings')
+arranged_order_ids = {f'SO{6100000000 + i}' for i in range(235, 245)}
+
+
+@pytest.fixture
+def database_location(tmp_path):
+    location = str(tmp_path / 'ginee_orders.db')
+    with closing(sqlite3.connect(location)) as conn:
+        conn.execute("CREATE TABLE credentials (platform TEXT, user TEXT, password TEXT);")
+        conn.execute("INSERT INTO credentials VALUES ('Ginee', 'shop@example.com', 'password');")
+        conn.execute("""CREATE TABLE orders (ginee_order_id TEXT PRIMARY KEY, order_number TEXT,
+                                             synced_at TIMESTAMP, store TEXT);""")
+        conn.commit()
+    return location
+
+
+def sync(database_location, recording, **kwargs):
+    """Syncs from one recording, a page missing from it fails the sync with a 404"""
+    server, base_url = serve_recordings(os.path.join(recordings_folder, recording))
+    try:
+        return OrderSync(base_url=base_url, database_location=database_location).sync(**kwargs)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def recorded_orders(recording):
+    orders = []
+    for file_location in glob.glob(os.path.join(recordings_folder, recording, '*_PAID_*.json')):
+        with open(file_location) as f:
+            orders += json.load(f)['data']['content']
+    return orders
+
+
+def newest_order_times(orders):
+    newest = {}
+    for order in orders:
+        newest[order_store(order)] = max(newest.get(order_store(order), ''), order_time(order))
+    return newest
+
+
+def query(database_location, sql):
+    with closing(sqlite3.connect(database_location)) as conn:
+        return conn.execute(sql).fetchall()
+
+
+def test_first_sync_is_full(database_location):
+    rows = sync(database_location, 'full_sync')
+    assert len(rows) == 250
+    assert query(database_location, "SELECT COUNT(*) FROM orders;") == [(250,)]
+    state = dict(query(database_location, "SELECT store, last_full_sync FROM sync_state;"))
+    assert set(state) == {'Sookee', 'Edge'} and None not in state.values()
+    marks = dict(query(database_location, "SELECT store, last_order_time FROM sync_state;"))
+    assert marks == newest_order_times(recorded_orders('full_sync'))
+
+
+def test_incremental_sync_stops_at_known_orders(database_location):
+    sync(database_location, 'full_sync')
+    rows = sync(database_location, 'incremental_sync')     # within FULL_SYNC_INTERVAL, so incremental
+    assert len(rows) == 200
+    assert query(database_location, "SELECT COUNT(*) FROM orders;") == [(258,)]
+    assert query(database_location, "SELECT COUNT(*) FROM left_paid;") == [(0,)]
+    marks = dict(query(database_location, "SELECT store, last_order_time FROM sync_state;"))
+    assert marks == newest_order_times(recorded_orders('incremental_sync'))
+
+
+def test_full_sync_marks_orders_that_left_paid(database_location):
+    sync(database_location, 'full_sync')
+    sync(database_location, 'left_paid_sync', full=True)
+    left_paid = {order_id for order_id, in query(database_location, "SELECT ginee_order_id FROM left_paid;")}
+    assert left_paid == arranged_order_ids
+
+    # orders back in PAID are no longer marked, the 8 newer orders missing from full_sync are
+    sync(database_location, 'full_sync', full=True)
+    left_paid = {order_id for order_id, in query(database_location, "SELECT ginee_order_id FROM left_paid;")}
+    assert left_paid == {f'SO{6100000000 + i}' for i in range(250, 258)}
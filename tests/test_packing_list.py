@@ -0,0 +1,36 @@
+"""Order number extraction against the page dicts saved in Packing List.json & Picking List.json"""
+import os
+import pytest
+from Ginee_Packing_List import extract_order_numbers, index_order_numbers, load_pdf_json
+
+
+script_folder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def fixture_index(file_name):
+    page_orders = [list(extract_order_numbers(page_dict))
+                   for page_dict in load_pdf_json(os.path.join(script_folder, file_name))]
+    return page_orders, index_order_numbers(page_orders)
+
+
+@pytest.mark.parametrize('file_name, orders, occurrences, multiple_packages', [
+    ('Packing List.json', 37, 45, {'415122114905411': 2, '415392732305205': 2, '414919157129403': 2,
+                                   '413522893879314': 2, '413317216931855': 5}),
+    ('Picking List.json', 4, 4, {}),
+])
+def test_order_numbers(file_name, orders, occurrences, multiple_packages):
+    page_orders, order_index = fixture_index(file_name)
+    assert len(order_index) == orders
+    assert sum(len(occurrence) for occurrence in order_index.values()) == occurrences
+    assert {order_number: len(occurrence) for order_number, occurrence in order_index.items()
+            if len(occurrence) > 1} == multiple_packages
+
+
+def test_order_index_keeps_page_order():
+    page_orders, order_index = fixture_index('Packing List.json')
+    for order_number, occurrences in order_index.items():
+        pages = [occurrence['page'] for occurrence in occurrences]
+        assert pages == sorted(pages)
+        for occurrence in occurrences:
+            assert (order_number, tuple(occurrence['bbox'])) in \
+                   [(number, tuple(bbox)) for number, bbox in page_orders[occurrence['page']]]